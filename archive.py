@@ -0,0 +1,166 @@
+"""
+Холодный архив истории: старые диалоги переносятся из базы в Parquet (zstd),
+разбитый по месяцам начала диалога, и удаляются из горячих таблиц.
+
+Структура каталога:
+    <archive_dir>/messages/month=YYYY-MM/bucket=<первый символ conv_id>/part-<пакет>.parquet
+    <archive_dir>/conversations/month=YYYY-MM/part-<пакет>.parquet
+
+Имя файла выводится из набора диалогов пакета: если коммит удаления не прошёл, следующий
+запуск перезапишет те же файлы, а не добавит копии.
+"""
+import hashlib
+import logging
+import os
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.orm import aliased
+
+from database import Conversation, Database, Message
+
+MESSAGE_COLUMNS = [
+    "id", "role", "user_id", "user_name", "reply_user_id", "content",
+    "conv_id", "timestamp", "message_id", "system_prompt", "rag_promt",
+]
+CONVERSATION_COLUMNS = ["id", "user_id", "conv_id", "timestamp"]
+ROW_GROUP_SIZE = 5000
+
+
+def message_schema() -> Any:
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.int64()),
+        ("role", pa.string()),
+        ("user_id", pa.int64()),
+        ("user_name", pa.string()),
+        ("reply_user_id", pa.int64()),
+        ("content", pa.string()),
+        ("conv_id", pa.string()),
+        ("timestamp", pa.int64()),
+        ("message_id", pa.int64()),
+        ("system_prompt", pa.string()),
+        ("rag_promt", pa.string()),
+    ])
+
+
+def conversation_schema() -> Any:
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.int64()),
+        ("user_id", pa.int64()),
+        ("conv_id", pa.string()),
+        ("timestamp", pa.int64()),
+    ])
+
+
+def _month(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m")
+
+
+def _message_partitioning() -> Any:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    # Явные типы: иначе каталоги bucket=1..9 прочитаются как числа
+    return ds.partitioning(pa.schema([("month", pa.string()), ("bucket", pa.string())]), flavor="hive")
+
+
+def _write_partition(archive_dir: str, table_name: str, partition: str, name: str, rows: List[Dict[str, Any]], schema: Any) -> str:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    directory = os.path.join(archive_dir, table_name, partition)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{name}.parquet")
+    # Файлы с точкой в начале имени dataset не читает, поэтому недописанный файл не виден
+    temporary = os.path.join(directory, f".part-{name}.parquet.tmp")
+    pq.write_table(
+        pa.Table.from_pylist(rows, schema=schema), temporary, compression="zstd", row_group_size=ROW_GROUP_SIZE
+    )
+    os.replace(temporary, path)
+    return path
+
+
+def archive_conversations(db: Database, archive_dir: str, older_than_days: int, batch_size: int = 500) -> int:
+    """
+    Переносит в архив диалоги, начатые раньше older_than_days дней назад.
+    Текущий (последний) диалог пользователя не архивируется, даже если он старый.
+    Строки удаляются из базы только после успешной записи файлов. Диалоги пакета блокируются
+    (SELECT ... FOR UPDATE SKIP LOCKED, где база это поддерживает), так что параллельный запуск
+    берёт другие диалоги.
+    """
+    cutoff = db.get_current_ts() - older_than_days * 86400
+    newer = aliased(Conversation)
+    has_newer = exists().where(
+        newer.user_id == Conversation.user_id,
+        or_(
+            newer.timestamp > Conversation.timestamp,
+            and_(newer.timestamp == Conversation.timestamp, newer.id > Conversation.id),
+        ),
+    )
+    archived = 0
+    while True:
+        with db.Session() as session:
+            conversations = (
+                session.query(Conversation)
+                .filter(Conversation.timestamp < cutoff, has_newer)
+                .order_by(Conversation.id)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            if not conversations:
+                return archived
+            months = {conv.conv_id: _month(conv.timestamp) for conv in conversations}
+            messages = (
+                session.query(Message)
+                .filter(Message.conv_id.in_(list(months)))
+                .order_by(Message.conv_id, Message.timestamp, Message.id)
+                .all()
+            )
+
+            name = hashlib.sha1("\n".join(sorted(months)).encode()).hexdigest()[:16]
+            message_rows: Dict[str, List[Dict[str, Any]]] = {}
+            for m in messages:
+                partition = f"month={months[m.conv_id]}/bucket={m.conv_id[:1]}"
+                message_rows.setdefault(partition, []).append({c: getattr(m, c) for c in MESSAGE_COLUMNS})
+            conversation_rows: Dict[str, List[Dict[str, Any]]] = {}
+            for conv in conversations:
+                conversation_rows.setdefault(f"month={months[conv.conv_id]}", []).append(
+                    {c: getattr(conv, c) for c in CONVERSATION_COLUMNS}
+                )
+            for partition, rows in message_rows.items():
+                _write_partition(archive_dir, "messages", partition, name, rows, message_schema())
+            for partition, rows in conversation_rows.items():
+                _write_partition(archive_dir, "conversations", partition, name, rows, conversation_schema())
+
+            session.query(Message).filter(Message.conv_id.in_(list(months))).delete(synchronize_session=False)
+            session.query(Conversation).filter(Conversation.id.in_([c.id for c in conversations])).delete(
+                synchronize_session=False
+            )
+            session.commit()
+        archived += len(conversations)
+        logging.info(f"В архив перенесено диалогов: {archived}")
+
+
+def load_archived_messages(archive_dir: str, conv_id: str) -> List[Any]:
+    """Сообщения диалога из архива в порядке (timestamp, id) с доступом к полям как у модели Message."""
+    import pyarrow.dataset as ds
+
+    path = os.path.join(archive_dir, "messages")
+    if not os.path.isdir(path):
+        return []
+    dataset = ds.dataset(path, format="parquet", partitioning=_message_partitioning())
+    # bucket отсекает каталоги до открытия файлов, conv_id — группы строк по статистике:
+    # внутри файла строки отсортированы по conv_id
+    condition = (ds.field("bucket") == conv_id[:1]) & (ds.field("conv_id") == conv_id)
+    rows = dataset.to_table(filter=condition, columns=MESSAGE_COLUMNS).to_pylist()
+    # Повторный запуск после сбоя мог записать диалог в файл пакета другого состава
+    rows = list({row["id"]: row for row in rows}.values())
+    rows.sort(key=lambda row: (row["timestamp"] or 0, row["id"]))
+    return [SimpleNamespace(**row) for row in rows]
@@ -0,0 +1,193 @@
+"""
+Микробенчмарки горячих путей Database.
+
+Заполняет базу (SQLite или Postgres) синтетическими диалогами и меряет задержку
+и количество SQL-запросов/коммитов на один вызов каждого метода.
+
+Запуск:
+    python -m benchmarks.bench_database --db_url=sqlite:///bench.db --messages=1000000
+
+Для CI те же случаи на малой базе собраны в pytest-benchmark: benchmarks/test_database.py.
+"""
+import asyncio
+import random
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+
+import fire  # type: ignore
+from sqlalchemy import event, insert
+
+from database import Conversation, Database, Message
+from write_behind import WriteBehindQueue
+
+
+SEED_BATCH_SIZE = 50_000
+
+
+@dataclass
+class QueryCounter:
+    queries: int = 0
+    commits: int = 0
+
+    def attach(self, db: Database) -> None:
+        event.listen(db.engine, "before_cursor_execute", self._on_execute)
+        event.listen(db.engine, "commit", self._on_commit)
+
+    def reset(self) -> None:
+        self.queries = 0
+        self.commits = 0
+
+    def _on_execute(self, *args: Any) -> None:
+        self.queries += 1
+
+    def _on_commit(self, *args: Any) -> None:
+        self.commits += 1
+
+
+@dataclass
+class BenchResult:
+    name: str
+    timings: List[float] = field(default_factory=list)
+    queries: int = 0
+    commits: int = 0
+
+    def row(self) -> Dict[str, Any]:
+        timings = sorted(self.timings)
+        calls = len(timings)
+        p99 = timings[min(calls - 1, int(calls * 0.99))]
+        return {
+            "name": self.name,
+            "min_ms": timings[0] * 1000,
+            "mean_ms": statistics.fmean(timings) * 1000,
+            "median_ms": statistics.median(timings) * 1000,
+            "p99_ms": p99 * 1000,
+            "ops": calls / sum(timings),
+            "queries/call": self.queries / calls,
+            "commits/call": self.commits / calls,
+        }
+
+
+def seed(db: Database, conversations: int, messages: int) -> List[Dict[str, Any]]:
+    """Заполняет базу диалогами и сообщениями пачками, минуя ORM."""
+    rng = random.Random(0)
+    now = db.get_current_ts()
+    users = max(1, conversations // 3)
+    convs = [
+        {"user_id": rng.randrange(users), "conv_id": f"{i:032x}", "timestamp": now - rng.randrange(86400 * 90)}
+        for i in range(conversations)
+    ]
+    with db.Session() as session:
+        session.execute(insert(Conversation), convs)
+        session.commit()
+
+        for start in range(0, messages, SEED_BATCH_SIZE):
+            batch = []
+            for _ in range(start, min(messages, start + SEED_BATCH_SIZE)):
+                conv = convs[rng.randrange(conversations)]
+                is_user = rng.random() < 0.5
+                batch.append({
+                    "role": "user" if is_user else "assistant",
+                    "user_id": conv["user_id"] if is_user else None,
+                    "user_name": f"user{conv['user_id']}" if is_user else None,
+                    "reply_user_id": None if is_user else conv["user_id"],
+                    "content": "x" * rng.randrange(20, 400),
+                    "conv_id": conv["conv_id"],
+                    "timestamp": conv["timestamp"] + rng.randrange(3600),
+                    "message_id": None if is_user else rng.randrange(1 << 30),
+                })
+            session.execute(insert(Message), batch)
+            session.commit()
+    return convs
+
+
+def bench(name: str, func: Callable[[], Any], iterations: int, counter: QueryCounter) -> BenchResult:
+    for _ in range(min(10, iterations)):
+        func()
+    counter.reset()
+    result = BenchResult(name)
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        result.timings.append(time.perf_counter() - start)
+    result.queries = counter.queries
+    result.commits = counter.commits
+    return result
+
+
+def bench_write_behind(
+    db: Database, convs: List[Dict[str, Any]], iterations: int, counter: QueryCounter
+) -> BenchResult:
+    """Задержка постановки сообщения в WriteBehindQueue и коммиты с учётом финального сброса."""
+    rng = random.Random(2)
+
+    async def run() -> BenchResult:
+        queue = WriteBehindQueue(db)
+        queue.start()
+        counter.reset()
+        result = BenchResult("save_user_message (write-behind)")
+        for _ in range(iterations):
+            conv = convs[rng.randrange(len(convs))]
+            start = time.perf_counter()
+            queue.save_user_message("bench message", conv_id=conv["conv_id"], user_id=1, user_name="bench")
+            result.timings.append(time.perf_counter() - start)
+            await asyncio.sleep(0)
+        await queue.stop()
+        result.queries = counter.queries
+        result.commits = counter.commits
+        return result
+
+    return asyncio.run(run())
+
+
+def main(
+    db_url: str = "sqlite:///bench.db",
+    conversations: int = 5_000,
+    messages: int = 1_000_000,
+    temp_chats: int = 1_000,
+    iterations: int = 1_000,
+    skip_seed: bool = False,
+) -> None:
+    db = Database(db_url)
+    if skip_seed:
+        with db.Session() as session:
+            convs = [
+                {"user_id": c.user_id, "conv_id": c.conv_id}
+                for c in session.query(Conversation.user_id, Conversation.conv_id)
+            ]
+    else:
+        start = time.perf_counter()
+        convs = seed(db, conversations, messages)
+        print(f"seeded {conversations} conversations / {messages} messages in {time.perf_counter() - start:.1f}s")
+
+    for chat_id in range(temp_chats):
+        db.set_temp_data(chat_id, "equation_text", "x^2 + 2x + 1 = 0")
+
+    counter = QueryCounter()
+    counter.attach(db)
+    rng = random.Random(1)
+
+    def pick() -> Dict[str, Any]:
+        return convs[rng.randrange(len(convs))]
+
+    cases: Dict[str, Callable[[], Any]] = {
+        "get_current_conv_id": lambda: db.get_current_conv_id(pick()["user_id"]),
+        "fetch_conversation": lambda: db.fetch_conversation(pick()["conv_id"]),
+        "save_user_message": lambda: db.save_user_message(
+            "bench message", conv_id=pick()["conv_id"], user_id=1, user_name="bench"
+        ),
+        "set_temp_data": lambda: db.set_temp_data(rng.randrange(temp_chats), "equation_text", "x + 1 = 2"),
+        "get_temp_data": lambda: db.get_temp_data(rng.randrange(temp_chats), "equation_text"),
+    }
+
+    rows = [bench(name, func, iterations, counter).row() for name, func in cases.items()]
+    rows.append(bench_write_behind(db, convs, iterations, counter).row())
+    header = list(rows[0].keys())
+    print(" | ".join(f"{h:>20}" for h in header))
+    for row in rows:
+        print(" | ".join(f"{v:>20.3f}" if isinstance(v, float) else f"{v:>20}" for v in row.values()))
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
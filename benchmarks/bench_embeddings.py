@@ -0,0 +1,80 @@
+"""
+Пропускная способность EmbeddingService на CPU.
+
+- ingest: эмбеддингов в секунду при разных размерах пакета документов;
+- queries: конкурентные запросы поштучно и через микропакеты;
+- cache: повторные запросы из LRU.
+
+Запуск:
+    python -m benchmarks.bench_embeddings --model_name=intfloat/multilingual-e5-small \\
+        --batch_sizes=1,8,32,64,128,256 --concurrency=64
+"""
+import asyncio
+import random
+import time
+from typing import Optional, Sequence
+
+import fire  # type: ignore
+
+from embeddings import EmbeddingService
+
+WORDS = (
+    "уравнение корень дискриминант функция производная интеграл предел матрица вектор "
+    "множество многочлен степень логарифм синус косинус площадь объём треугольник угол"
+).split()
+
+
+def make_texts(count: int, words: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(words)) for _ in range(count)]
+
+
+async def run_queries(service: EmbeddingService, queries: list, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(query: str) -> None:
+        async with semaphore:
+            await service.embed_query(query)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    return time.perf_counter() - started_at
+
+
+def main(
+    model_name: str = "intfloat/multilingual-e5-small",
+    onnx_file_name: Optional[str] = None,
+    batch_sizes: Sequence[int] = (1, 8, 32, 64, 128, 256),
+    documents: int = 1024,
+    document_words: int = 120,
+    queries: int = 512,
+    concurrency: int = 64,
+    num_threads: Optional[int] = None,
+) -> None:
+    service = EmbeddingService(model_name=model_name, onnx_file_name=onnx_file_name, num_threads=num_threads)
+    started_at = time.perf_counter()
+    service.load()
+    print(f"load: {time.perf_counter() - started_at:.1f}s")
+
+    texts = make_texts(documents, document_words)
+    service.embed_documents(texts[:8])  # прогрев
+    for batch_size in batch_sizes:
+        started_at = time.perf_counter()
+        service.embed_documents(texts, batch_size=batch_size)
+        elapsed = time.perf_counter() - started_at
+        print(f"ingest batch={batch_size:>4}: {documents / elapsed:8.1f} эмб/с")
+
+    query_texts = make_texts(queries, 12, seed=1)
+    for name, max_batch_size in (("unbatched", 1), ("micro-batched", service.max_batch_size)):
+        candidate = EmbeddingService(model_name=model_name, max_batch_size=max_batch_size, cache_size=0)
+        candidate.model, candidate.tokenizer = service.model, service.tokenizer
+        elapsed = asyncio.run(run_queries(candidate, query_texts, concurrency))
+        print(f"queries {name:>13}: {queries / elapsed:8.1f} запр/с при {concurrency} одновременных")
+
+    asyncio.run(run_queries(service, query_texts, concurrency))
+    elapsed = asyncio.run(run_queries(service, query_texts, concurrency))
+    print(f"queries        cached: {queries / elapsed:8.1f} запр/с")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,115 @@
+"""
+Точность и скорость MathOCR в разных режимах инференса на наборе изображений уравнений.
+
+Набор по умолчанию рендерится из FIXTURE_EQUATIONS через matplotlib; можно передать
+свой каталог с картинками и файлом expected.json вида {"имя_файла": "latex"}.
+
+Запуск:
+    python -m benchmarks.bench_ocr --modes=default,int8 --num_threads=4
+"""
+import io
+import json
+import os
+import statistics
+import time
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Tuple
+
+import fire  # type: ignore
+from PIL import Image
+
+from ocr import MathOCR
+
+
+FIXTURE_EQUATIONS = [
+    "2x + 3 = 7",
+    "x^2 - 5x + 6 = 0",
+    "\\frac{x}{2} + \\frac{1}{3} = 1",
+    "\\sqrt{x + 4} = 3",
+    "3x^3 - 2x^2 + x - 5 = 0",
+    "\\int_0^1 x^2 dx",
+    "\\frac{d}{dx} \\sin(x^2)",
+    "\\log_2(x) = 5",
+    "e^{2x} - 1 = 0",
+    "\\sum_{k=1}^{n} k^2",
+    "\\lim_{x \\to 0} \\frac{\\sin x}{x}",
+    "|2x - 1| < 3",
+]
+
+
+def render_fixture(formula: str) -> Image.Image:
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(6, 2))
+    fig.text(0.5, 0.5, f"${formula}$", fontsize=20, ha="center", va="center")
+    buffer = io.BytesIO()
+    fig.savefig(buffer, dpi=150, bbox_inches="tight", pad_inches=0.1, format="png")
+    buffer.seek(0)
+    return Image.open(buffer).convert("RGB")
+
+
+def load_fixtures(fixtures_dir: Optional[str]) -> List[Tuple[Image.Image, str]]:
+    if fixtures_dir is None:
+        return [(render_fixture(formula), formula) for formula in FIXTURE_EQUATIONS]
+    with open(os.path.join(fixtures_dir, "expected.json"), encoding="utf-8") as r:
+        expected: Dict[str, str] = json.load(r)
+    return [
+        (Image.open(os.path.join(fixtures_dir, name)).convert("RGB"), formula)
+        for name, formula in expected.items()
+    ]
+
+
+def normalize(latex: str) -> str:
+    return "".join(latex.strip().strip("$").split())
+
+
+def bench_mode(
+    mode: str,
+    fixtures: List[Tuple[Image.Image, str]],
+    num_threads: Optional[int],
+    num_interop_threads: Optional[int],
+) -> Dict[str, float]:
+    ocr = MathOCR(inference_mode=mode, num_threads=num_threads, num_interop_threads=num_interop_threads)
+    started_at = time.perf_counter()
+    ocr.load()
+    load_seconds = time.perf_counter() - started_at
+    ocr.infer_image(fixtures[0][0].copy(), 0)
+
+    timings, similarities, exact = [], [], 0
+    for image, formula in fixtures:
+        started_at = time.perf_counter()
+        output = ocr.infer_image(image.copy(), 0)
+        timings.append(time.perf_counter() - started_at)
+        similarity = SequenceMatcher(None, normalize(output), normalize(formula)).ratio()
+        similarities.append(similarity)
+        exact += normalize(output) == normalize(formula)
+
+    timings.sort()
+    return {
+        "load_s": load_seconds,
+        "mean_ms": statistics.fmean(timings) * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        "exact_match": exact / len(fixtures),
+        "similarity": statistics.fmean(similarities),
+    }
+
+
+def main(
+    modes: str = "default,int8",
+    fixtures_dir: Optional[str] = None,
+    num_threads: Optional[int] = None,
+    num_interop_threads: Optional[int] = None,
+) -> None:
+    fixtures = load_fixtures(fixtures_dir)
+    print(f"{len(fixtures)} fixtures")
+    print(f"{'mode':>10} | {'load_s':>8} | {'mean_ms':>9} | {'p95_ms':>9} | {'exact':>6} | {'similarity':>10}")
+    for mode in modes.split(",") if isinstance(modes, str) else modes:
+        stats = bench_mode(mode, fixtures, num_threads, num_interop_threads)
+        print(
+            f"{mode:>10} | {stats['load_s']:>8.1f} | {stats['mean_ms']:>9.1f} | {stats['p95_ms']:>9.1f} | "
+            f"{stats['exact_match']:>6.2f} | {stats['similarity']:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,81 @@
+"""
+Время до первого токена (TTFT) на локальной модели при старой и новой сборке промпта.
+
+legacy — как было: system переключается на rag_prompt при включённом RAG, подсказки кэша не передаются.
+stable — build_messages с неизменным префиксом и cache_prompt/id_slot из конфигурации провайдера.
+
+Запуск:
+    python -m benchmarks.bench_prompt_cache --providers_config_path=configs/provider.json \\
+        --provider_name=ruadapt_qwen2.5_3b_ext_u48_instruct_v4_gguf --turns=8
+"""
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+import fire  # type: ignore
+
+from prompt import build_messages
+from provider import LLMProvider
+
+
+QUESTIONS = [
+    "Как решить квадратное уравнение x^2 - 5x + 6 = 0?",
+    "А если дискриминант отрицательный?",
+    "Покажи теорему Виета на этом примере.",
+    "Как разложить многочлен на множители?",
+    "Чем отличается линейное уравнение от квадратного?",
+    "Как проверить найденные корни?",
+    "Реши 2x + 3 = 7.",
+    "Что такое область допустимых значений?",
+]
+CONTEXT = ["Квадратное уравнение ax^2 + bx + c = 0 решается через дискриминант D = b^2 - 4ac."] * 3
+
+
+async def time_to_first_token(provider: LLMProvider, messages: List[Dict[str, Any]], **kwargs: Any) -> float:
+    started_at = time.perf_counter()
+    stream = await provider.api.chat.completions.create(
+        model=provider.model_name, messages=messages, stream=True, max_tokens=32, **kwargs
+    )
+    ttft = None
+    async for chunk in stream:
+        if ttft is None and chunk.choices and chunk.choices[0].delta.content:
+            ttft = time.perf_counter() - started_at
+    return ttft if ttft is not None else time.perf_counter() - started_at
+
+
+async def run_conversation(provider: LLMProvider, turns: int, stable: bool) -> List[float]:
+    history: List[Dict[str, Any]] = []
+    timings = []
+    for turn in range(turns):
+        question = QUESTIONS[turn % len(QUESTIONS)]
+        use_rag = turn % 2 == 0
+        content = provider.rag_prompt.format(context=CONTEXT, question=question) if use_rag else question
+        new_turn = {"role": "user", "content": content}
+        if stable:
+            messages = build_messages(provider.system_prompt, history + [new_turn], provider.merge_system_prompt)
+            kwargs = {"extra_body": provider.cache_hints(cache_key=1)}
+        else:
+            system_prompt = provider.rag_prompt if use_rag else provider.system_prompt
+            messages = build_messages(system_prompt, history + [new_turn])
+            kwargs = {}
+        timings.append(await time_to_first_token(provider, messages, **kwargs))
+        history += [{"role": "user", "content": question}, {"role": "assistant", "content": "Ответ " * 40}]
+    return timings
+
+
+def main(providers_config_path: str, provider_name: str, turns: int = 8) -> None:
+    with open(providers_config_path, encoding="utf-8") as r:
+        provider = LLMProvider(provider_name=provider_name, **json.load(r)[provider_name])
+
+    for name, stable in (("legacy", False), ("stable", True)):
+        timings = asyncio.run(run_conversation(provider, turns, stable))
+        print(
+            f"{name:>7}: mean TTFT {statistics.fmean(timings) * 1000:.0f}ms, "
+            f"last turn {timings[-1] * 1000:.0f}ms, per turn {[round(t * 1000) for t in timings]}"
+        )
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,53 @@
+"""
+Разбивка стоимости старта бота: время импорта модулей и, по желанию, загрузки OCR.
+
+Запуск:
+    python -m benchmarks.bench_startup --module=bot --top=20 --with_ocr=True
+"""
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+import fire  # type: ignore
+
+
+def import_breakdown(module: str) -> Tuple[float, List[Tuple[int, int, str]]]:
+    """Импортирует модуль в чистом интерпретаторе с -X importtime и разбирает отчёт."""
+    started_at = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    wall = time.perf_counter() - started_at
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return wall, rows
+
+
+def main(module: str = "bot", top: int = 20, with_ocr: bool = False) -> None:
+    wall, rows = import_breakdown(module)
+    print(f"import {module}: {wall * 1000:.0f}ms wall (including interpreter start)")
+    print(f"{'cumulative_ms':>14} {'self_ms':>10}  module")
+    # Верхнеуровневые пакеты (без отступа) показывают, что стоит отложить
+    top_level = [row for row in rows if not row[2].startswith("  ")]
+    for self_us, cumulative_us, name in sorted(top_level, key=lambda row: -row[1])[:top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>10.1f}  {name.strip()}")
+
+    if with_ocr:
+        from ocr import MathOCR
+
+        ocr = MathOCR()
+        started_at = time.perf_counter()
+        ocr.load()
+        print(f"MathOCR.load: {(time.perf_counter() - started_at) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
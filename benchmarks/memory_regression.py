@@ -0,0 +1,260 @@
+"""
+Регрессия памяти: N циклов generate и /solve (текст и фото) на настоящем LlmBot,
+у которого Telegram, LLM, OCR и LanceDB заменены локальными заглушками.
+База — SQLite во временном каталоге, рендер формул и CAS настоящие.
+
+После прогрева фиксируются RSS и heap (tracemalloc), затем выполняются циклы.
+Скрипт завершается с кодом 1 и печатает крупнейший прирост, если RSS или heap
+выросли больше порога.
+
+В CI короткий прогон собирается pytest как tests/test_memory_regression.py.
+Длинный прогон перед релизом:
+    python -m benchmarks.memory_regression --cycles=300 --warmup=50 --max_rss_growth_mb=30 --max_heap_growth_mb=5
+"""
+import asyncio
+import gc
+import io
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+from typing import Any, List, Optional
+
+import fire  # type: ignore
+from PIL import Image, ImageDraw
+
+from bot import LlmBot
+from memory import MemoryProfiler, rss_bytes
+
+PROVIDER_NAME = "ruadapt_qwen2.5_3b_ext_u48_instruct_v4_gguf"
+SUBJECT = "Алгебра"
+CHUNKS = [f"Фрагмент учебника {i}: квадратное уравнение решается через дискриминант." for i in range(10)]
+ANSWER = "Решение: переносим слагаемые, находим x. " * 20
+EQUATIONS = ["2x + 3 = 7", "x^2 - 5x + 6 = 0", "\\int_{0}^{1} x^2 \\, dx", "\\sin x = \\frac{x}{2}"]
+
+_message_ids = itertools.count(1)
+
+
+class FakeMessage:
+    def __init__(self, chat_id: int, text: Optional[str] = "", photo: Any = None):
+        self.message_id = next(_message_ids)
+        self.chat = SimpleNamespace(id=chat_id)
+        self.from_user = SimpleNamespace(id=chat_id, full_name=f"user {chat_id}", username=f"user{chat_id}")
+        self.text = text
+        self.photo = photo
+        self.media_group_id = None
+
+    async def reply(self, text: str, **kwargs: Any) -> "FakeMessage":
+        return FakeMessage(self.chat.id, text)
+
+    async def answer(self, text: str, **kwargs: Any) -> "FakeMessage":
+        return FakeMessage(self.chat.id, text)
+
+    async def edit_text(self, text: str, **kwargs: Any) -> "FakeMessage":
+        self.text = text
+        return self
+
+    async def reply_photo(self, photo: Any, **kwargs: Any) -> "FakeMessage":
+        return FakeMessage(self.chat.id)
+
+
+class FakeCallback:
+    def __init__(self, message: FakeMessage, data: str):
+        self.message = message
+        self.from_user = message.from_user
+        self.data = data
+
+    async def answer(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+
+class FakeTelegram:
+    def __init__(self, photo: bytes):
+        self.photo = photo
+
+    async def get_me(self) -> Any:
+        return SimpleNamespace(id=1, username="fake_bot")
+
+    async def get_file(self, file_id: str) -> Any:
+        return SimpleNamespace(file_path=f"photos/{file_id}.jpg")
+
+    async def download_file(self, file_path: str, destination: io.BytesIO) -> None:
+        destination.write(self.photo)
+        destination.seek(0)
+
+    async def edit_message_reply_markup(self, **kwargs: Any) -> None:
+        pass
+
+
+class FakeCompletions:
+    async def create(self, **kwargs: Any) -> Any:
+        message = SimpleNamespace(content=ANSWER)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], model_extra={})
+
+
+class FakeOCR:
+    is_loaded = True
+
+    def __init__(self) -> None:
+        self._equations = itertools.cycle(EQUATIONS)
+
+    def load(self) -> None:
+        pass
+
+    def infer_pages(self, images: List[Image.Image], temperature: float, detect_regions: bool = False) -> List[str]:
+        return [next(self._equations) for _ in images]
+
+
+class FakeSearch:
+    def __getattr__(self, name: str) -> Any:
+        # vector(), text(), limit() и прочие звенья цепочки запроса
+        return lambda *args, **kwargs: self
+
+    def to_pandas(self) -> Any:
+        return {"text": SimpleNamespace(to_list=lambda: list(CHUNKS))}
+
+
+class FakeVectorDB:
+    def open_table(self, name: str) -> Any:
+        # Таблица со встроенными эмбеддингами LanceDB: вектор запроса считает сама таблица
+        schema = SimpleNamespace(metadata={b"embedding_functions": b"[]"})
+        return SimpleNamespace(schema=schema, search=lambda *args, **kwargs: FakeSearch())
+
+
+def make_photo() -> bytes:
+    image = Image.new("RGB", (1600, 900), "white")
+    ImageDraw.Draw(image).text((100, 400), "2x + 3 = 7", fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def make_bot(directory: str) -> LlmBot:
+    paths = {name: os.path.join(directory, f"{name}.json") for name in ("bot", "provider", "subject")}
+    configs = {
+        "bot": {
+            "token": "123456:" + "A" * 35,
+            "ocr_warmup": False,
+            "maintenance_enabled": False,
+            "overload_enabled": False,
+            "send_per_chat_rate": 1e9,
+            "send_per_chat_burst": 1e9,
+            "send_global_rate": 1e9,
+        },
+        "provider": {
+            PROVIDER_NAME: {
+                "base_url": "http://127.0.0.1:9/v1",
+                "api_key": "fake",
+                "model_name": "fake",
+                "system_prompt": "Ты помощник по математике.",
+                "rag_prompt": "Контекст: {context}\nВопрос: {question}",
+            }
+        },
+        "subject": {SUBJECT: "algebra"},
+    }
+    for name, config in configs.items():
+        with open(paths[name], "w", encoding="utf-8") as w:
+            json.dump(config, w, ensure_ascii=False)
+
+    bot = LlmBot(
+        db_path=f"sqlite:///{os.path.join(directory, 'bot.db')}",
+        db_vector_path=os.path.join(directory, "lancedb"),
+        providers_config_path=paths["provider"],
+        bot_config_path=paths["bot"],
+        subject_path=paths["subject"],
+        ocr=FakeOCR(),
+    )
+    bot.bot = FakeTelegram(make_photo())
+    bot._vectordb = FakeVectorDB()
+    for provider in bot.providers.values():
+        provider.api = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    return bot
+
+
+async def run_cycle(bot: LlmBot, cycle: int, chats: int) -> None:
+    chat_id = 1000 + cycle % chats
+    await bot.generate(FakeMessage(chat_id, f"Как решить уравнение номер {cycle}?"))
+    if cycle % 2:
+        photo = [SimpleNamespace(file_id=f"photo{cycle}", width=1600, height=900)]
+        solve = FakeMessage(chat_id, text=None, photo=photo)
+    else:
+        solve = FakeMessage(chat_id, f"/solve {EQUATIONS[cycle // 2 % len(EQUATIONS)]}")
+    await bot.handle_equation(solve)
+    await bot.confirm_equation_handler(FakeCallback(FakeMessage(chat_id), "confirm_equation"))
+
+
+async def scenario(bot: LlmBot, warmup: int, cycles: int, chats: int, profiler: MemoryProfiler) -> dict:
+    await bot._on_startup()
+    try:
+        for chat_id in range(1000, 1000 + chats):
+            bot.db.set_current_subject(chat_id, SUBJECT)
+        for cycle in range(warmup):
+            await run_cycle(bot, cycle, chats)
+        await bot.writer.flush()
+        gc.collect()
+        profiler.start()
+        rss_before = rss_bytes()
+        heap_before = tracemalloc.get_traced_memory()[0]
+
+        started_at = time.perf_counter()
+        for cycle in range(warmup, warmup + cycles):
+            await run_cycle(bot, cycle, chats)
+        await bot.writer.flush()
+        elapsed = time.perf_counter() - started_at
+        gc.collect()
+        return {
+            "rss_growth": rss_bytes() - rss_before,
+            "heap_growth": tracemalloc.get_traced_memory()[0] - heap_before,
+            "elapsed": elapsed,
+        }
+    finally:
+        await bot._on_shutdown()
+
+
+def measure(cycles: int, warmup: int, chats: int, profiler: MemoryProfiler) -> dict:
+    """Прирост RSS и heap за cycles циклов после warmup циклов прогрева, в байтах."""
+    previous_disable = logging.root.manager.disable
+    logging.disable(logging.WARNING)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            bot = make_bot(directory)
+            # generate печатает каждое сообщение в stdout
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                return asyncio.run(scenario(bot, warmup, cycles, chats, profiler))
+    finally:
+        logging.disable(previous_disable)
+
+
+def main(
+    cycles: int = 50,
+    warmup: int = 10,
+    chats: int = 20,
+    max_rss_growth_mb: float = 30.0,
+    max_heap_growth_mb: float = 5.0,
+) -> None:
+    profiler = MemoryProfiler(frames=10)
+    result = measure(cycles, warmup, chats, profiler)
+
+    rss_mb = result["rss_growth"] / 2 ** 20
+    heap_mb = result["heap_growth"] / 2 ** 20
+    print(
+        f"{cycles} циклов generate + /solve за {result['elapsed']:.1f}s: "
+        f"RSS {rss_mb:+.1f} MB ({result['rss_growth'] / cycles / 1024:+.1f} KB/цикл), "
+        f"heap {heap_mb:+.2f} MB ({result['heap_growth'] / cycles / 1024:+.2f} KB/цикл)"
+    )
+    failed = rss_mb > max_rss_growth_mb or heap_mb > max_heap_growth_mb
+    if failed:
+        print(f"Превышен порог: RSS {max_rss_growth_mb} MB, heap {max_heap_growth_mb} MB")
+        print(profiler.report(limit=15))
+    profiler.stop()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,94 @@
+"""
+Те же горячие пути Database, что и в bench_database, в виде набора pytest-benchmark
+на небольшой SQLite-базе: запускается в CI и сравнивается между прогонами.
+
+Запуск:
+    python -m pytest benchmarks/test_database.py --benchmark-autosave
+    python -m pytest benchmarks/test_database.py --benchmark-compare --benchmark-compare-fail=median:20%
+
+Крупную базу (миллион сообщений, Postgres) по-прежнему меряет python -m benchmarks.bench_database.
+"""
+import asyncio
+import random
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from benchmarks.bench_database import QueryCounter, seed
+from database import Database
+from write_behind import WriteBehindQueue
+
+CONVERSATIONS = 500
+MESSAGES = 20_000
+TEMP_CHATS = 100
+WRITE_BEHIND_MESSAGES = 1_000
+
+
+@pytest.fixture(scope="module")
+def seeded(tmp_path_factory: pytest.TempPathFactory) -> Iterator[Tuple[Database, List[Dict[str, Any]], QueryCounter]]:
+    db = Database(f"sqlite:///{tmp_path_factory.mktemp('bench') / 'bench.db'}")
+    convs = seed(db, CONVERSATIONS, MESSAGES)
+    for chat_id in range(TEMP_CHATS):
+        db.set_temp_data(chat_id, "equation_text", "x^2 + 2x + 1 = 0")
+    counter = QueryCounter()
+    counter.attach(db)
+    yield db, convs, counter
+    db.engine.dispose()
+
+
+def run(benchmark: Any, counter: QueryCounter, func: Callable[[], Any]) -> None:
+    """Меряет func и записывает в отчёт SQL-запросы и коммиты на вызов."""
+    calls = 0
+
+    def call() -> Any:
+        nonlocal calls
+        calls += 1
+        return func()
+
+    counter.reset()
+    benchmark(call)
+    benchmark.extra_info["queries/call"] = counter.queries / calls
+    benchmark.extra_info["commits/call"] = counter.commits / calls
+
+
+CASES: Dict[str, Callable[[Database, Callable[[], Dict[str, Any]], random.Random], Callable[[], Any]]] = {
+    "get_current_conv_id": lambda db, pick, rng: lambda: db.get_current_conv_id(pick()["user_id"]),
+    "fetch_conversation": lambda db, pick, rng: lambda: db.fetch_conversation(pick()["conv_id"]),
+    "save_user_message": lambda db, pick, rng: lambda: db.save_user_message(
+        "bench message", conv_id=pick()["conv_id"], user_id=1, user_name="bench"
+    ),
+    "set_temp_data": lambda db, pick, rng: lambda: db.set_temp_data(
+        rng.randrange(TEMP_CHATS), "equation_text", "x + 1 = 2"
+    ),
+    "get_temp_data": lambda db, pick, rng: lambda: db.get_temp_data(rng.randrange(TEMP_CHATS), "equation_text"),
+}
+
+
+@pytest.mark.parametrize("name", list(CASES))
+def test_database(benchmark: Any, seeded: Tuple[Database, List[Dict[str, Any]], QueryCounter], name: str) -> None:
+    db, convs, counter = seeded
+    rng = random.Random(1)
+    run(benchmark, counter, CASES[name](db, lambda: convs[rng.randrange(len(convs))], rng))
+
+
+def test_write_behind(benchmark: Any, seeded: Tuple[Database, List[Dict[str, Any]], QueryCounter]) -> None:
+    """Пачка сообщений через WriteBehindQueue вместе с финальным сбросом: коммиты на сообщение."""
+    db, convs, counter = seeded
+    rng = random.Random(2)
+
+    async def burst() -> None:
+        queue = WriteBehindQueue(db)
+        queue.start()
+        for _ in range(WRITE_BEHIND_MESSAGES):
+            conv = convs[rng.randrange(len(convs))]
+            queue.save_user_message("bench message", conv_id=conv["conv_id"], user_id=1, user_name="bench")
+            await asyncio.sleep(0)
+        await queue.stop()
+
+    rounds = 5
+    counter.reset()
+    benchmark.pedantic(lambda: asyncio.run(burst()), rounds=rounds, iterations=1)
+    benchmark.extra_info["commits/message"] = counter.commits / (rounds * WRITE_BEHIND_MESSAGES)
+    assert counter.commits < rounds * WRITE_BEHIND_MESSAGES / 10
@@ -0,0 +1,163 @@
+"""
+Детектор блокировок event loop для отладки и канареечных запусков.
+
+Корутина-пульс отмечается в loop каждые heartbeat_ms, сторожевой поток следит за пульсом.
+Если loop не отвечает дольше threshold_ms, поток снимает стек потока loop через
+sys._current_frames(), а когда loop оживает — логирует длительность, обработчик,
+место вызова и стек. Счётчики копятся по месту вызова и периодически сводятся в лог.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from metrics import REGISTRY, MetricsRegistry
+
+_PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _is_project_file(filename: str) -> bool:
+    # Виртуальное окружение внутри репозитория (./.venv/.../site-packages) — не код проекта
+    return (
+        filename.startswith(_PROJECT_ROOT)
+        and "site-packages" not in filename.split(os.sep)
+        and os.path.basename(filename) != "blocking.py"
+    )
+
+
+def _blame(stack: traceback.StackSummary) -> Tuple[str, str]:
+    """
+    Обработчик — самый внешний кадр кода проекта в текущем шаге задачи (после Handle._run),
+    место вызова — самый внутренний кадр кода проекта.
+    """
+    task_start = max(
+        (i for i, frame in enumerate(stack) if frame.filename.endswith(os.path.join("asyncio", "events.py"))),
+        default=-1,
+    )
+    own = [frame for frame in list(stack)[task_start + 1:] if _is_project_file(frame.filename)]
+    if not own:
+        innermost = stack[-1] if stack else None
+        site = f"{os.path.basename(innermost.filename)}:{innermost.lineno} в {innermost.name}" if innermost else "?"
+        return "?", site
+    handler, site = own[0], own[-1]
+    return handler.name, f"{os.path.relpath(site.filename, _PROJECT_ROOT)}:{site.lineno} в {site.name}"
+
+
+class BlockingDetector:
+    def __init__(
+        self,
+        threshold_ms: float = 100.0,
+        heartbeat_ms: float = 20.0,
+        report_interval_s: float = 300.0,
+        stack_limit: int = 40,
+        asyncio_debug: bool = False,
+        metrics: MetricsRegistry = REGISTRY,
+    ):
+        """
+        :param asyncio_debug: Дополнительно включить debug-режим asyncio со slow_callback_duration = threshold_ms;
+            он ловит медленные колбэки без стека, зато с указанием Handle.
+        """
+        self.threshold = threshold_ms / 1000
+        self.heartbeat = heartbeat_ms / 1000
+        self.report_interval = report_interval_s
+        self.stack_limit = stack_limit
+        self.asyncio_debug = asyncio_debug
+        self.metrics = metrics
+        self.counts: Counter = Counter()
+        self.blocked_ms: Dict[str, float] = {}
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Вызывается из потока loop."""
+        if self._thread is not None:
+            return
+        if self.asyncio_debug:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._heartbeat_task = loop.create_task(self._heartbeat_loop())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="blocking-detector", daemon=True)
+        self._thread.start()
+        logging.info(f"Детектор блокировок event loop включён, порог {self.threshold * 1000:.0f}ms")
+
+    async def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+        self._log_summary()
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(self.heartbeat)
+
+    def _watch(self) -> None:
+        captured: Optional[Tuple[float, List[str], str, str]] = None
+        last_report = time.monotonic()
+        while not self._stop.wait(self.heartbeat):
+            now = time.monotonic()
+            beat = self._last_beat
+            expected = beat + self.heartbeat
+            if captured is None:
+                if now - expected > self.threshold:
+                    captured = (expected, *self._capture())
+            elif beat >= captured[0]:
+                # Пульс возобновился: блокировка закончилась
+                started_at, stack, handler, site = captured
+                self._record(beat - started_at, stack, handler, site)
+                captured = None
+            if now - last_report >= self.report_interval:
+                last_report = now
+                self._log_summary()
+
+    def _capture(self) -> Tuple[List[str], str, str]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return [], "?", "?"
+        stack = traceback.extract_stack(frame, limit=self.stack_limit)
+        handler, site = _blame(stack)
+        return stack.format(), handler, site
+
+    def _record(self, duration: float, stack: List[str], handler: str, site: str) -> None:
+        duration_ms = duration * 1000
+        self.counts[site] += 1
+        self.blocked_ms[site] = self.blocked_ms.get(site, 0.0) + duration_ms
+        self.metrics.inc("loop_blocked_total", site=site)
+        self.metrics.inc("loop_blocked_ms", duration_ms, site=site)
+        logging.warning(
+            f"Event loop заблокирован на {duration_ms:.0f}ms в обработчике {handler}, место вызова {site} "
+            f"(уже {self.counts[site]} раз)\n" + "".join(stack)
+        )
+
+    def summary(self, limit: int = 10) -> List[Tuple[str, int, float]]:
+        """Места вызова с наибольшим суммарным временем блокировки: (место, раз, всего ms)."""
+        sites = sorted(self.blocked_ms, key=self.blocked_ms.get, reverse=True)[:limit]
+        return [(site, self.counts[site], self.blocked_ms[site]) for site in sites]
+
+    def _log_summary(self) -> None:
+        top = self.summary()
+        if top:
+            logging.warning(
+                "Сводка блокировок event loop:\n"
+                + "\n".join(f"{total:8.0f}ms {count:5d} раз — {site}" for site, count, total in top)
+            )
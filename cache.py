@@ -0,0 +1,105 @@
+import json
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+MISSING = object()
+
+InvalidateCallback = Callable[[str, Hashable], None]
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш с ограничением времени жизни записей."""
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return MISSING
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class CacheInvalidator:
+    """Инвалидация в пределах одного процесса: рассылать некому."""
+
+    def publish(self, namespace: str, key: Hashable) -> None:
+        pass
+
+    def subscribe(self, callback: InvalidateCallback) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class RedisCacheInvalidator(CacheInvalidator):
+    """
+    Межпроцессная инвалидация через Redis pub/sub для нескольких экземпляров бота.
+    Собственные сообщения игнорируются: локальный кэш уже обновлён при записи.
+    """
+
+    def __init__(self, url: str, channel: str = "rag_math:cache_invalidation"):
+        import redis  # type: ignore
+
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+        self.instance_id = secrets.token_hex(8)
+        self._pubsub: Optional[Any] = None
+        self._thread: Optional[Any] = None
+
+    def publish(self, namespace: str, key: Hashable) -> None:
+        payload = json.dumps({"source": self.instance_id, "namespace": namespace, "key": key})
+        try:
+            self.client.publish(self.channel, payload)
+        except Exception as e:
+            logging.error(f"Не удалось разослать инвалидацию кэша: {e}")
+
+    def subscribe(self, callback: InvalidateCallback) -> None:
+        def handler(message: Any) -> None:
+            data = json.loads(message["data"])
+            if data["source"] != self.instance_id:
+                callback(data["namespace"], data["key"])
+
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.channel: handler})
+        self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._thread.stop()
+        if self._pubsub is not None:
+            self._pubsub.close()
+        self.client.close()
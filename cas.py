@@ -0,0 +1,523 @@
+"""
+Быстрый путь без модели: распознанное уравнение в LaTeX приводится к выражению sympy,
+классифицируется и, если класс стандартный, решается локально с пошаговым ответом по шаблонам.
+
+Поддерживаются: линейные, квадратные и полиномиальные уравнения с одной переменной,
+системы линейных уравнений, неопределённые и определённые интегралы, производные.
+Корни уравнений ищутся среди действительных чисел. Остальное (None из solve_problem) уходит в LLM.
+
+sympy импортируется лениво: он нужен только при решении. Решение выполняется в отдельных
+процессах CasPool: длинная арифметика sympy держит GIL, поэтому поток не прервать тайм-аутом,
+а процесс можно убить.
+"""
+import asyncio
+import multiprocessing
+import re
+import signal
+import string
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+Step = Dict[str, str]
+
+# Имена, которые могут дойти до parse_expr; остальные буквы становятся отдельными переменными.
+# parse_expr выполняет строку через eval, поэтому ничего другого в неё не пропускается.
+_FUNCTIONS = {
+    "arcsin": "asin", "arccos": "acos", "arctan": "atan", "arctg": "atan", "arcctg": "acot",
+    "sin": "sin", "cos": "cos", "tan": "tan", "tg": "tan", "cot": "cot", "ctg": "cot",
+    "exp": "exp", "ln": "log", "log": "log", "sqrt": "sqrt", "pi": "pi",
+}
+_FUNCTION_PREFIXES = sorted(_FUNCTIONS, key=len, reverse=True)
+_SAFE_TEXT_RE = re.compile(r"^[0-9a-zA-Z+\-*/^().\s]*$")
+_BAD_DOT_RE = re.compile(r"\.(?!\d)|(?<!\d)\.")
+# Ограничения размера: без них одно сообщение вроде 9^{9^{9}} надолго занимает процессор
+_MAX_INTEGER_DIGITS = 9
+_MAX_EXPONENT = 12
+_INTEGER_RE = re.compile(r"\d+")
+_NUMERIC_EXPONENT_RE = re.compile(r"\^[\s(]*(\d+)")
+
+_LATEX_REPLACEMENTS = [
+    ("{,}", "."), ("\\left", ""), ("\\right", ""), ("\\cdot", "*"), ("\\times", "*"), ("\\div", "/"),
+    ("\\,", " "), ("\\;", " "), ("\\:", " "), ("\\!", ""), ("\\quad", " "), ("\\ ", " "),
+    ("\\dfrac", "\\frac"), ("\\tfrac", "\\frac"), ("\\operatorname", ""), ("\\mathrm", ""),
+]
+_SYSTEM_ENV_RE = re.compile(r"\\(begin|end)\{(cases|aligned|align\*?|array|gathered|system)\}(\{[^}]*\})?")
+_INTEGRAL_RE = re.compile(
+    r"^\\int(?:_(\{[^{}]*\}|\S)\^(\{[^{}]*\}|\S))?(.+?)\s*(?:\\[,;!]\s*)*d([a-zA-Z])\s*$", re.S
+)
+_DERIVATIVE_RE = re.compile(r"^\\frac\{d\}\{d([a-zA-Z])\}(.+)$", re.S)
+
+
+class UnsupportedProblem(ValueError):
+    pass
+
+
+@dataclass
+class CasSolution:
+    kind: str
+    steps: List[Step] = field(default_factory=list)
+    answer: str = ""
+
+
+def _read_group(text: str, start: int) -> Tuple[str, int]:
+    """Содержимое группы {...} или одиночного символа, начиная с start; возвращает и индекс после неё."""
+    while start < len(text) and text[start] == " ":
+        start += 1
+    if start >= len(text):
+        raise UnsupportedProblem("Незакрытая группа")
+    if text[start] != "{":
+        return text[start], start + 1
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == "{":
+            depth += 1
+        elif text[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start + 1:i], i + 1
+    raise UnsupportedProblem("Незакрытая скобка")
+
+
+def _expand_commands(text: str) -> str:
+    """\\frac и \\sqrt в скобочную запись, рекурсивно для вложенных групп."""
+    result = []
+    i = 0
+    while i < len(text):
+        if text.startswith("\\frac", i):
+            numerator, i = _read_group(text, i + 5)
+            denominator, i = _read_group(text, i)
+            result.append(f"(({_expand_commands(numerator)})/({_expand_commands(denominator)}))")
+        elif text.startswith("\\sqrt", i):
+            i += 5
+            degree = None
+            if i < len(text) and text[i] == "[":
+                end = text.index("]", i)
+                degree, i = text[i + 1:end], end + 1
+            radicand, i = _read_group(text, i)
+            radicand = _expand_commands(radicand)
+            if degree is None:
+                result.append(f"sqrt({radicand})")
+            else:
+                result.append(f"(({radicand})^(1/({_expand_commands(degree)})))")
+        else:
+            result.append(text[i])
+            i += 1
+    return "".join(result)
+
+
+def _split_identifiers(text: str) -> str:
+    """Разбивает буквенные последовательности на известные функции и однобуквенные переменные."""
+    def split(match: "re.Match[str]") -> str:
+        word = match.group(0)
+        parts = []
+        while word:
+            prefix = next((name for name in _FUNCTION_PREFIXES if word.startswith(name)), None)
+            if prefix is not None:
+                parts.append(_FUNCTIONS[prefix])
+                word = word[len(prefix):]
+            else:
+                parts.append(word[0])
+                word = word[1:]
+        return " ".join(parts)
+
+    return re.sub(r"[a-zA-Z]+", split, text)
+
+
+def latex_to_expression_text(latex: str) -> str:
+    """LaTeX-выражение без знака равенства в безопасную строку для parse_expr."""
+    text = latex.strip().strip("$")
+    for old, new in _LATEX_REPLACEMENTS:
+        text = text.replace(old, new)
+    text = _expand_commands(text)
+    text = re.sub(r"\\([a-zA-Z]+)", lambda m: m.group(1) if m.group(1) in _FUNCTIONS else f"\\{m.group(1)}", text)
+    if "\\" in text:
+        raise UnsupportedProblem(f"Неизвестная команда LaTeX в {latex!r}")
+    text = text.replace("{", "(").replace("}", ")").replace("[", "(").replace("]", ")").replace(":", "/")
+    text = _split_identifiers(text)
+    if not _SAFE_TEXT_RE.match(text) or _BAD_DOT_RE.search(text):
+        raise UnsupportedProblem(f"Недопустимые символы в {latex!r}")
+    if any(len(number) > _MAX_INTEGER_DIGITS for number in _INTEGER_RE.findall(text)):
+        raise UnsupportedProblem(f"Слишком длинное число в {latex!r}")
+    if any(int(exponent) > _MAX_EXPONENT for exponent in _NUMERIC_EXPONENT_RE.findall(text)):
+        raise UnsupportedProblem(f"Слишком большая степень в {latex!r}")
+    return text
+
+
+def _check_powers(expression: Any, scale: int = 1) -> None:
+    """
+    Числовой показатель степени — небольшое рациональное число, в том числе с учётом вложенных
+    степеней ((x^12)^12 — это x^144). Показатель проверяется до вычисления, поэтому
+    степенные башни вроде 9^{9^{9}} отклоняются, а не считаются.
+    """
+    from sympy import Pow
+
+    if isinstance(expression, Pow) and not expression.exp.free_symbols:
+        _check_powers(expression.exp)
+        exponent = expression.exp.doit()
+        if not exponent.is_Rational:
+            raise UnsupportedProblem(f"Нерациональный показатель степени: {exponent}")
+        scale *= max(abs(exponent.p), exponent.q)
+        if scale > _MAX_EXPONENT:
+            raise UnsupportedProblem(f"Слишком большая степень: {expression}")
+        _check_powers(expression.base, scale)
+        return
+    for arg in expression.args:
+        _check_powers(arg, scale)
+
+
+def parse_latex(latex: str) -> Any:
+    from sympy import E, Symbol, nsimplify, pi
+    from sympy.parsing.sympy_parser import (
+        convert_xor,
+        implicit_multiplication_application,
+        parse_expr,
+        standard_transformations,
+    )
+
+    text = latex_to_expression_text(latex)
+    if not text.strip():
+        raise UnsupportedProblem("Пустое выражение")
+    transformations = standard_transformations + (implicit_multiplication_application, convert_xor)
+    try:
+        # Каждая одиночная буква — переменная, даже если в sympy так называется объект (S, N, Q, ...)
+        local_dict = {letter: Symbol(letter) for letter in string.ascii_letters}
+        local_dict.update(e=E, pi=pi)
+        # Без вычисления: размеры степеней проверяются до того, как sympy начнёт их считать
+        expression = parse_expr(text, local_dict=local_dict, transformations=transformations, evaluate=False)
+    except Exception as e:
+        raise UnsupportedProblem(f"Не удалось разобрать {latex!r}: {e}") from e
+    _check_powers(expression)
+    # Десятичные дроби становятся точными: 0.5x = 1 даёт x = 2, а не x = 2.00000000000000
+    return nsimplify(expression.doit(), rational=True)
+
+
+def _fmt(expr: Any) -> str:
+    from sympy import sstr
+
+    return sstr(expr).replace("**", "^")
+
+
+def _split_lines(text: str) -> List[str]:
+    text = _SYSTEM_ENV_RE.sub("\n", text).replace("&", "")
+    parts = re.split(r"\\\\|\n|;", text)
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _pick_variable(symbols: Any) -> Any:
+    ordered = sorted(symbols, key=lambda s: s.name)
+    for name in ("x", "y", "z", "t"):
+        for symbol in ordered:
+            if symbol.name == name:
+                return symbol
+    return ordered[0]
+
+
+def _substitution_check(equations: List[Any], solution: Dict[Any, Any]) -> Step:
+    from sympy import simplify
+
+    lines = []
+    for equation in equations:
+        left = simplify(equation.lhs.subs(solution))
+        right = simplify(equation.rhs.subs(solution))
+        if simplify(left - right) != 0:
+            raise UnsupportedProblem("Проверка подстановкой не сошлась")
+        lines.append(f"{_fmt(left)} = {_fmt(right)}")
+    return {"explanation": "Проверка подстановкой в исходное уравнение", "calculation": "; ".join(lines)}
+
+
+def _solve_linear(equation: Any, variable: Any, a: Any, b: Any) -> CasSolution:
+    steps = [
+        {"explanation": "Переносим все слагаемые в левую часть", "calculation": f"{_fmt(a * variable + b)} = 0"},
+    ]
+    if a == 0:
+        answer = f"{variable} — любое число" if b == 0 else "решений нет"
+        steps.append({"explanation": "Коэффициент при переменной равен нулю", "calculation": f"0 = {_fmt(-b)}, {answer}"})
+        return CasSolution("linear", steps, answer)
+    root = -b / a
+    steps.append({"explanation": "Переносим свободный член вправо", "calculation": f"{_fmt(a * variable)} = {_fmt(-b)}"})
+    steps.append({"explanation": f"Делим обе части на {_fmt(a)}", "calculation": f"{variable} = {_fmt(root)}"})
+    steps.append(_substitution_check([equation], {variable: root}))
+    return CasSolution("linear", steps, f"{variable} = {_fmt(root)}")
+
+
+def _solve_quadratic(equation: Any, variable: Any, a: Any, b: Any, c: Any) -> CasSolution:
+    from sympy import sqrt, simplify
+
+    steps = [
+        {
+            "explanation": "Приводим к виду ax^2 + bx + c = 0",
+            "calculation": f"{_fmt(a * variable ** 2 + b * variable + c)} = 0; a = {_fmt(a)}, b = {_fmt(b)}, c = {_fmt(c)}",
+        }
+    ]
+    discriminant = simplify(b ** 2 - 4 * a * c)
+    steps.append({
+        "explanation": "Находим дискриминант D = b^2 - 4ac",
+        "calculation": f"D = ({_fmt(b)})^2 - 4·({_fmt(a)})·({_fmt(c)}) = {_fmt(discriminant)}",
+    })
+    if discriminant.is_positive:
+        roots = [simplify((-b - sqrt(discriminant)) / (2 * a)), simplify((-b + sqrt(discriminant)) / (2 * a))]
+        steps.append({
+            "explanation": "D > 0, уравнение имеет два корня: x = (-b ± √D) / 2a",
+            "calculation": f"{variable}1 = {_fmt(roots[0])}, {variable}2 = {_fmt(roots[1])}",
+        })
+        for root in roots:
+            steps.append(_substitution_check([equation], {variable: root}))
+        return CasSolution("quadratic", steps, f"{variable}1 = {_fmt(roots[0])}, {variable}2 = {_fmt(roots[1])}")
+    if discriminant.is_zero:
+        root = simplify(-b / (2 * a))
+        steps.append({"explanation": "D = 0, уравнение имеет один корень: x = -b / 2a", "calculation": f"{variable} = {_fmt(root)}"})
+        steps.append(_substitution_check([equation], {variable: root}))
+        return CasSolution("quadratic", steps, f"{variable} = {_fmt(root)}")
+    if discriminant.is_negative:
+        # Корни ищутся среди действительных чисел, как и в _solve_polynomial
+        steps.append({"explanation": "D < 0, действительных корней нет", "calculation": f"D = {_fmt(discriminant)} < 0"})
+        return CasSolution("quadratic", steps, "действительных корней нет")
+    raise UnsupportedProblem("Знак дискриминанта не определён")
+
+
+def _solve_polynomial(equation: Any, variable: Any, expression: Any) -> CasSolution:
+    from sympy import CRootOf, S, factor, solveset
+
+    factored = factor(expression)
+    roots = solveset(expression, variable, domain=S.Reals)
+    if not roots.is_FiniteSet or any(root.has(CRootOf) for root in roots):
+        raise UnsupportedProblem("Корни не выражаются в радикалах")
+    roots = sorted(roots, key=lambda r: float(r))
+    steps = [
+        {"explanation": "Переносим все слагаемые в левую часть", "calculation": f"{_fmt(expression)} = 0"},
+        {"explanation": "Раскладываем многочлен на множители", "calculation": f"{_fmt(factored)} = 0"},
+        {
+            "explanation": "Произведение равно нулю, когда один из множителей равен нулю",
+            "calculation": ", ".join(f"{variable} = {_fmt(root)}" for root in roots) or "действительных корней нет",
+        },
+    ]
+    for root in roots:
+        steps.append(_substitution_check([equation], {variable: root}))
+    answer = ", ".join(f"{variable} = {_fmt(root)}" for root in roots) or "действительных корней нет"
+    return CasSolution("polynomial", steps, answer)
+
+
+def _solve_equation(equation: Any) -> CasSolution:
+    from sympy import Poly, PolynomialError, expand
+
+    expression = expand(equation.lhs - equation.rhs)
+    if not expression.free_symbols:
+        raise UnsupportedProblem("В уравнении нет переменной")
+    if len(expression.free_symbols) > 1:
+        raise UnsupportedProblem("Уравнение с параметрами")
+    variable = _pick_variable(expression.free_symbols)
+    try:
+        poly = Poly(expression, variable)
+    except PolynomialError as e:
+        raise UnsupportedProblem("Уравнение не полиномиальное") from e
+    degree = poly.degree()
+    if degree <= 1:
+        a, b = poly.all_coeffs() if degree == 1 else (0, poly.all_coeffs()[0])
+        return _solve_linear(equation, variable, a, b)
+    if degree == 2:
+        return _solve_quadratic(equation, variable, *poly.all_coeffs())
+    return _solve_polynomial(equation, variable, expression)
+
+
+def _solve_system(equations: List[Any]) -> CasSolution:
+    from sympy import linear_eq_to_matrix, linsolve
+
+    variables = sorted(set().union(*(eq.free_symbols for eq in equations)), key=lambda s: s.name)
+    expressions = [eq.lhs - eq.rhs for eq in equations]
+    try:
+        linear_eq_to_matrix(expressions, variables)
+    except Exception as e:
+        raise UnsupportedProblem("Система не линейная") from e
+    steps = [{
+        "explanation": "Записываем систему линейных уравнений",
+        "calculation": "; ".join(f"{_fmt(eq.lhs)} = {_fmt(eq.rhs)}" for eq in equations),
+    }]
+    solutions = linsolve(expressions, variables)
+    if not solutions:
+        steps.append({"explanation": "Исключение переменных приводит к противоречию", "calculation": "0 = 1"})
+        return CasSolution("system", steps, "решений нет")
+    solution = dict(zip(variables, next(iter(solutions))))
+    first, rest = variables[0], variables[1:]
+    if rest:
+        from sympy import solve
+
+        expressed = solve(expressions[0], first)
+        if expressed:
+            steps.append({
+                "explanation": f"Выражаем {first} из первого уравнения и подставляем в остальные",
+                "calculation": f"{first} = {_fmt(expressed[0])}",
+            })
+    steps.append({
+        "explanation": "Решаем систему методом исключения переменных",
+        "calculation": ", ".join(f"{v} = {_fmt(value)}" for v, value in solution.items()),
+    })
+    if all(not value.free_symbols for value in solution.values()):
+        steps.append(_substitution_check(equations, solution))
+        answer = ", ".join(f"{v} = {_fmt(value)}" for v, value in solution.items())
+    else:
+        answer = "бесконечно много решений: " + ", ".join(f"{v} = {_fmt(value)}" for v, value in solution.items())
+    return CasSolution("system", steps, answer)
+
+
+def _solve_integral(match: "re.Match[str]") -> CasSolution:
+    from sympy import Integral, Symbol, integrate, simplify
+
+    lower, upper, integrand_latex, variable_name = match.groups()
+    variable = Symbol(variable_name)
+    integrand = parse_latex(integrand_latex)
+    antiderivative = simplify(integrate(integrand, variable))
+    if antiderivative.has(Integral):
+        raise UnsupportedProblem("Интеграл не берётся в элементарных функциях")
+    steps = [{
+        "explanation": "Находим первообразную",
+        "calculation": f"∫ {_fmt(integrand)} d{variable} = {_fmt(antiderivative)} + C",
+    }]
+    if lower is None:
+        return CasSolution("integral", steps, f"{_fmt(antiderivative)} + C")
+    a, b = parse_latex(lower.strip("{}")), parse_latex(upper.strip("{}"))
+    value = simplify(antiderivative.subs(variable, b) - antiderivative.subs(variable, a))
+    steps.append({
+        "explanation": "Применяем формулу Ньютона — Лейбница F(b) - F(a)",
+        "calculation": f"F({_fmt(b)}) - F({_fmt(a)}) = {_fmt(value)}",
+    })
+    return CasSolution("integral", steps, _fmt(value))
+
+
+def _solve_derivative(function_latex: str, variable_name: Optional[str]) -> CasSolution:
+    from sympy import Symbol, diff, simplify
+
+    function = parse_latex(function_latex)
+    if variable_name is None:
+        if not function.free_symbols:
+            raise UnsupportedProblem("Нет переменной дифференцирования")
+        variable = _pick_variable(function.free_symbols)
+    else:
+        variable = Symbol(variable_name)
+    derivative = diff(function, variable)
+    simplified = simplify(derivative)
+    steps = [
+        {"explanation": "Дифференцируем по правилам для суммы, произведения и сложной функции",
+         "calculation": f"({_fmt(function)})' = {_fmt(derivative)}"},
+    ]
+    if simplified != derivative:
+        steps.append({"explanation": "Упрощаем", "calculation": f"{_fmt(derivative)} = {_fmt(simplified)}"})
+    return CasSolution("derivative", steps, _fmt(simplified))
+
+
+def solve_problem(text: str) -> Optional[CasSolution]:
+    """Решение стандартной задачи или None, если её нужно отдать LLM."""
+    from sympy import Eq
+
+    try:
+        text = text.strip().strip("$").strip()
+        integral = _INTEGRAL_RE.match(text)
+        if integral:
+            return _solve_integral(integral)
+        derivative = _DERIVATIVE_RE.match(text)
+        if derivative:
+            return _solve_derivative(derivative.group(2), derivative.group(1))
+        if text.endswith("'") and "=" not in text:
+            return _solve_derivative(text[:-1], None)
+
+        lines = _split_lines(text)
+        if not lines or any(line.count("=") != 1 for line in lines):
+            return None
+        equations = []
+        for line in lines:
+            left, right = line.split("=")
+            equations.append(Eq(parse_latex(left), parse_latex(right), evaluate=False))
+        if len(equations) == 1:
+            return _solve_equation(equations[0])
+        return _solve_system(equations)
+    except UnsupportedProblem:
+        return None
+
+
+def _serve(connection: Any) -> None:
+    """Цикл процесса CasPool: текст задачи на входе, (решение, ошибка) на выходе; None — завершиться."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import sympy  # noqa: F401 — импорт до первой задачи, чтобы он не съедал её тайм-аут
+
+    connection.send(None)
+    while True:
+        try:
+            text = connection.recv()
+        except EOFError:
+            return
+        if text is None:
+            return
+        try:
+            connection.send((solve_problem(text), None))
+        except Exception as e:
+            connection.send((None, f"{type(e).__name__}: {e}"))
+
+
+class _CasProcess:
+    def __init__(self, context: Any):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child,), name="cas", daemon=True)
+        self.process.start()
+        child.close()
+        self.connection.recv()
+
+    def solve(self, text: str, timeout: float) -> Optional[Tuple[Optional[CasSolution], Optional[str]]]:
+        """None, если процесс не ответил за timeout секунд."""
+        self.connection.send(text)
+        if not self.connection.poll(timeout):
+            return None
+        return self.connection.recv()
+
+    def close(self) -> None:
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(1.0)
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+class CasPool:
+    """
+    Процессы для solve_problem. Процесс, не уложившийся в timeout, убивается и при следующей
+    задаче заменяется новым, так что зависшее решение не занимает ни процессор, ни потоки бота.
+    """
+
+    def __init__(self, processes: int = 2, timeout: float = 3.0):
+        self.timeout = timeout
+        self._context = multiprocessing.get_context("spawn")
+        self._slots = asyncio.Semaphore(processes)
+        self._idle: List[_CasProcess] = []
+
+    async def solve(self, text: str) -> Optional[CasSolution]:
+        """
+        Решение стандартной задачи или None, если её нужно отдать LLM.
+
+        :raises asyncio.TimeoutError: решение не уложилось в timeout, процесс убит
+        :raises RuntimeError: процесс решения упал с ошибкой
+        """
+        async with self._slots:
+            worker = self._idle.pop() if self._idle else await asyncio.to_thread(_CasProcess, self._context)
+            try:
+                result = await asyncio.to_thread(worker.solve, text, self.timeout)
+            except BaseException:
+                # Ответ процесса может прийти позже и перепутаться со следующей задачей
+                worker.process.kill()
+                raise
+            if result is None:
+                await asyncio.to_thread(worker.kill)
+                raise asyncio.TimeoutError(f"Решение не уложилось в {self.timeout}s")
+            self._idle.append(worker)
+        solution, error = result
+        if error is not None:
+            raise RuntimeError(error)
+        return solution
+
+    def close(self) -> None:
+        while self._idle:
+            self._idle.pop().close()
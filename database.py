@@ -1,12 +1,16 @@
 import secrets
 import json
 import copy
-from typing import Optional, List, Any, Dict, Union
+from typing import Optional, List, Any, Dict, Tuple, Union
 from datetime import datetime, timezone
 
-from sqlalchemy import create_engine, Integer, String, Text, MetaData, func, Column, Table, ForeignKey
+from sqlalchemy import create_engine, Integer, String, Text, MetaData, func, Column, Table, ForeignKey, Index, insert
 from sqlalchemy.orm import DeclarativeBase, sessionmaker, mapped_column, Mapped
 
+from cache import MISSING, CacheInvalidator, TTLCache
+from ephemeral import EphemeralStore, InMemoryEphemeralStore
+from migrations import run_migrations
+
 
 metadata = MetaData()
 
@@ -17,13 +21,14 @@ class Base(DeclarativeBase):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (Index("ix_messages_conv_id_timestamp_id", "conv_id", "timestamp", "id"),)
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     role: Mapped[str]
     user_id: Mapped[Optional[int]]
-    user_name: Mapped[Optional[str]]
+    user_name: Mapped[Optional[str]] = mapped_column(String, nullable=True, index=True)
     reply_user_id: Mapped[Optional[int]]
     content: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
-    conv_id: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    conv_id: Mapped[str] = mapped_column(String, nullable=False)
     timestamp: Mapped[Optional[int]]
     message_id: Mapped[Optional[int]]
     system_prompt: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
@@ -40,8 +45,9 @@ class Subject(Base):
 
 class Conversation(Base):
     __tablename__ = "current_conversations"
+    __table_args__ = (Index("ix_current_conversations_user_id_timestamp", "user_id", "timestamp", "id"),)
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    user_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
     conv_id: Mapped[str] = mapped_column(String, nullable=False, unique=True)
     timestamp: Mapped[int]
 
@@ -55,21 +61,66 @@ class Like(Base):
     is_correct: Mapped[int]
 
 
-# Define a new table for temporary data
+# Устарело: временные данные живут в EphemeralStore, таблица очищается миграцией 2
 class TempData(Base):
     __tablename__ = "temp_data"
+    __table_args__ = (Index("uq_temp_data_chat_id_key", "chat_id", "key", unique=True),)
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    chat_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    chat_id: Mapped[int] = mapped_column(Integer, nullable=False)
     key: Mapped[str] = mapped_column(String, nullable=False)
     value: Mapped[str] = mapped_column(Text, nullable=False)
 
 
+def migrate_database(db_url: str) -> int:
+    """Создаёт таблицы и применяет миграции отдельным подключением; возвращает версию схемы."""
+    engine = create_engine(db_url)
+    try:
+        Base.metadata.create_all(engine)
+        return run_migrations(engine)
+    finally:
+        engine.dispose()
+
+
 class Database:
-    def __init__(self, db_url: str):
+    def __init__(
+        self,
+        db_url: str,
+        cache_size: int = 10_000,
+        cache_ttl: float = 300.0,
+        invalidator: Optional[CacheInvalidator] = None,
+        temp_store: Optional[EphemeralStore] = None,
+        archive_dir: Optional[str] = None,
+        migrate: bool = True,
+    ):
+        """
+        :param migrate: Создать таблицы и применить миграции; воркеры ShardedRunner получают
+            уже подготовленную фронтом схему и не гоняются друг с другом на старте.
+        """
         self.engine = create_engine(db_url)
-        Base.metadata.create_all(self.engine)
+        if migrate:
+            Base.metadata.create_all(self.engine)
+            run_migrations(self.engine)
         self.Session = sessionmaker(bind=self.engine)
 
+        # Текущий диалог и предмет меняются редко, а читаются на каждом сообщении
+        self._caches = {
+            "conv_id": TTLCache(maxsize=cache_size, ttl=cache_ttl),
+            "subject": TTLCache(maxsize=cache_size, ttl=cache_ttl),
+        }
+        self.invalidator = invalidator or CacheInvalidator()
+        self.invalidator.subscribe(self._on_remote_invalidate)
+        self.temp_store = temp_store or InMemoryEphemeralStore()
+        self.archive_dir = archive_dir
+
+    def _on_remote_invalidate(self, namespace: str, key: Any) -> None:
+        cache = self._caches.get(namespace)
+        if cache is not None:
+            cache.invalidate(key)
+
+    def _write_through(self, namespace: str, key: int, value: Any) -> None:
+        self._caches[namespace].set(key, value)
+        self.invalidator.publish(namespace, key)
+
     @staticmethod
     def get_current_ts() -> int:
         return int(datetime.now().replace(tzinfo=timezone.utc).timestamp())
@@ -83,32 +134,40 @@ class Database:
             new_conv = Conversation(user_id=user_id, conv_id=conv_id, timestamp=self.get_current_ts())
             session.add(new_conv)
             session.commit()
+        self._write_through("conv_id", user_id, conv_id)
         return conv_id
 
-    def get_user_id_by_conv_id(self, conv_id: str) -> int:
+    def get_user_id_by_conv_id(self, conv_id: str) -> Optional[int]:
+        """Владелец диалога или None, если диалога нет (в том числе уже перенесённого в архив)."""
         with self.Session() as session:
-            conv = (
-                session.query(Conversation)
-                .filter(Conversation.conv_id == conv_id)
-                .order_by(Conversation.timestamp.desc())
-                .first()
-            )
-            assert conv
-            return conv.user_id
+            return session.query(Conversation.user_id).filter(Conversation.conv_id == conv_id).scalar()
 
     def get_current_conv_id(self, user_id: int) -> str:
+        cached = self._caches["conv_id"].get(user_id)
+        if cached is not MISSING:
+            return cached
         with self.Session() as session:
-            conv = (
-                session.query(Conversation)
+            # id разрешает совпадения секундных timestamp: побеждает последняя созданная запись
+            conv_id = (
+                session.query(Conversation.conv_id)
                 .filter(Conversation.user_id == user_id)
-                .order_by(Conversation.timestamp.desc())
-                .first()
+                .order_by(Conversation.timestamp.desc(), Conversation.id.desc())
+                .limit(1)
+                .scalar()
             )
-            return conv.conv_id if conv else self.create_conv_id(user_id)
+            if not conv_id:
+                return self.create_conv_id(user_id)
+        self._caches["conv_id"].set(user_id, conv_id)
+        return conv_id
 
-    def fetch_conversation(self, conv_id: str) -> List[Any]:
+    def fetch_conversation(self, conv_id: str, include_archive: bool = False) -> List[Any]:
         with self.Session() as session:
-            messages = session.query(Message).filter(Message.conv_id == conv_id).order_by(Message.timestamp).all()
+            messages = session.query(Message).filter(Message.conv_id == conv_id).order_by(Message.timestamp, Message.id).all()
+            if not messages and include_archive and self.archive_dir:
+                # Диалог целиком уходит в архив, поэтому смотрим туда только при пустой выборке
+                from archive import load_archived_messages
+
+                messages = load_archived_messages(self.archive_dir, conv_id)
             if not messages:
                 return []
             clean_messages = []
@@ -125,31 +184,114 @@ class Database:
                 clean_messages.append(message)
             return clean_messages
 
+    def fetch_history_page(
+        self,
+        conv_id: str,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        limit: int = 10,
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Страница истории для показа пользователю: только id, role, content и timestamp,
+        keyset по id. Без якоря возвращает последние сообщения. Второй элемент — есть ли
+        ещё сообщения дальше в направлении листания.
+        """
+        with self.Session() as session:
+            query = session.query(Message.id, Message.role, Message.content, Message.timestamp).filter(
+                Message.conv_id == conv_id
+            )
+            if after_id is not None:
+                query = query.filter(Message.id > after_id).order_by(Message.id)
+            else:
+                if before_id is not None:
+                    query = query.filter(Message.id < before_id)
+                query = query.order_by(Message.id.desc())
+            rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if after_id is None:
+            rows.reverse()
+        page = [
+            {"id": row.id, "role": row.role, "content": self._parse_content(row.content), "timestamp": row.timestamp}
+            for row in rows
+        ]
+        return page, has_more
+
     def get_user_id(self, user_name: str) -> int:
         with self.Session() as session:
-            user_id = session.query(Message.user_id).filter(Message.user_name == user_name).distinct().first()
+            user_id = session.query(Message.user_id).filter(Message.user_name == user_name).first()
             assert user_id, f"User ID not found for {user_name}"
             return int(user_id[0])
 
-    def save_user_message(
+    def user_message_row(
         self,
         content: Union[None, str, List[Dict[str, Any]]],
         conv_id: str,
         user_id: int,
         user_name: Optional[str] = None,
-    ) -> None:
+    ) -> Dict[str, Any]:
+        return {
+            "role": "user",
+            "content": self._serialize_content(content),
+            "conv_id": conv_id,
+            "user_id": user_id,
+            "user_name": user_name,
+            "reply_user_id": None,
+            "timestamp": self.get_current_ts(),
+            "message_id": None,
+            "system_prompt": None,
+            "rag_promt": None,
+        }
+
+    def assistant_message_row(
+        self,
+        content: Union[str, List[Dict[str, Any]]],
+        conv_id: str,
+        message_id: int,
+        reply_user_id: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+        rag_promt: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        return {
+            "role": "assistant",
+            "content": self._serialize_content(content),
+            "conv_id": conv_id,
+            "user_id": None,
+            "user_name": None,
+            "reply_user_id": reply_user_id,
+            "timestamp": self.get_current_ts(),
+            "message_id": message_id,
+            "system_prompt": system_prompt,
+            "rag_promt": rag_promt,
+        }
+
+    @staticmethod
+    def feedback_row(feedback: str, user_id: int, message_id: int) -> Dict[str, Any]:
+        return {
+            "user_id": user_id,
+            "message_id": message_id,
+            "feedback": feedback,
+            "is_correct": 1,
+        }
+
+    def save_rows(self, messages: List[Dict[str, Any]], likes: List[Dict[str, Any]]) -> None:
+        """Пакетная вставка сообщений и оценок одной транзакцией."""
         with self.Session() as session:
-            new_message = Message(
-                role="user",
-                content=self._serialize_content(content),
-                conv_id=conv_id,
-                user_id=user_id,
-                user_name=user_name,
-                timestamp=self.get_current_ts(),
-            )
-            session.add(new_message)
+            if messages:
+                session.execute(insert(Message), messages)
+            if likes:
+                session.execute(insert(Like), likes)
             session.commit()
 
+    def save_user_message(
+        self,
+        content: Union[None, str, List[Dict[str, Any]]],
+        conv_id: str,
+        user_id: int,
+        user_name: Optional[str] = None,
+    ) -> None:
+        self.save_rows([self.user_message_row(content, conv_id, user_id, user_name)], [])
+
     def save_assistant_message(
         self,
         content: Union[str, List[Dict[str, Any]]],
@@ -160,40 +302,20 @@ class Database:
         rag_promt: Optional[str] = None,
 
     ) -> None:
-        with self.Session() as session:
-            new_message = Message(
-                role="assistant",
-                content=self._serialize_content(content),
-                conv_id=conv_id,
-                timestamp=self.get_current_ts(),
-                message_id=message_id,
-                rag_promt = rag_promt,
-                system_prompt=system_prompt,
-                reply_user_id=reply_user_id,
-            )
-            session.add(new_message)
-            session.commit()
+        row = self.assistant_message_row(content, conv_id, message_id, reply_user_id, system_prompt, rag_promt)
+        self.save_rows([row], [])
 
 
     def save_feedback(self, feedback: str, user_id: int, message_id: int) -> None:
-        with self.Session() as session:
-            new_feedback = Like(
-                user_id=user_id,
-                message_id=message_id,
-                feedback=feedback,
-                is_correct=1,
-            )
-            session.add(new_feedback)
-            session.commit()
+        self.save_rows([], [self.feedback_row(feedback, user_id, message_id)])
 
 
     def get_all_conv_ids(self, min_timestamp: Optional[int] = None) -> List[str]:
         with self.Session() as session:
-            if min_timestamp is None:
-                conversations = session.query(Conversation).all()
-            else:
-                conversations = session.query(Conversation).filter(Conversation.timestamp >= min_timestamp).all()
-            return [conv.conv_id for conv in conversations]
+            query = session.query(Conversation.conv_id)
+            if min_timestamp is not None:
+                query = query.filter(Conversation.timestamp >= min_timestamp)
+            return [conv_id for (conv_id,) in query]
 
     def _serialize_content(self, content: Union[None, str, List[Dict[str, Any]]]) -> str:
         if isinstance(content, str):
@@ -224,27 +346,23 @@ class Database:
                 new_subject = Subject(user_id=user_id, subject=subject_name)
                 session.add(new_subject)
                 session.commit()
+        self._write_through("subject", user_id, {"subject": subject_name})
 
     def get_current_subject(self, user_id: int) -> Optional[Dict[str, Any]]:
+        cached = self._caches["subject"].get(user_id)
+        if cached is not MISSING:
+            return dict(cached) if cached is not None else None
         with self.Session() as session:
             subject = session.query(Subject).filter(Subject.user_id == user_id).first()
-            return {
+            result = {
                 "subject": subject.subject,
             } if subject else None
+        # Отсутствие строки тоже кэшируется, чтобы не ходить в базу на каждом сообщении
+        self._caches["subject"].set(user_id, result)
+        return dict(result) if result is not None else None
 
-    def set_temp_data(self, chat_id: int, key: str, value: str) -> None:
-        with self.Session() as session:
-            temp_data = session.query(TempData).filter(TempData.chat_id == chat_id, TempData.key == key).first()
-            if temp_data:
-                temp_data.value = value
-            else:
-                new_temp_data = TempData(chat_id=chat_id, key=key, value=value)
-                session.add(new_temp_data)
-            session.commit()
+    def set_temp_data(self, chat_id: int, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self.temp_store.set(f"{chat_id}:{key}", value, ttl=ttl)
 
     def get_temp_data(self, chat_id: int, key: str) -> Optional[str]:
-        with self.Session() as session:
-            temp_data = session.query(TempData).filter(TempData.chat_id == chat_id, TempData.key == key).first()
-            return temp_data.value if temp_data else None
-
-
+        return self.temp_store.get(f"{chat_id}:{key}")
@@ -0,0 +1,165 @@
+"""
+Общий CPU-движок эмбеддингов для поиска и загрузки документов.
+
+Модель экспортируется в ONNX через optimum (или берётся готовый, в том числе квантизованный,
+ONNX-файл из репозитория модели) и загружается лениво. Запросы из разных обработчиков
+собираются в микропакеты, эмбеддинги запросов кэшируются, документы идут крупными пакетами.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+
+from cache import MISSING, TTLCache
+
+# Ключ метаданных схемы таблицы LanceDB с именем модели, которой посчитаны векторы
+EMBEDDING_MODEL_KEY = b"embedding_model"
+# Под этим ключом LanceDB хранит собственные функции эмбеддингов таблицы
+LANCEDB_EMBEDDING_FUNCTIONS_KEY = b"embedding_functions"
+
+
+class EmbeddingService:
+    def __init__(
+        self,
+        model_name: str = "intfloat/multilingual-e5-small",
+        onnx_file_name: Optional[str] = None,
+        query_prefix: str = "query: ",
+        passage_prefix: str = "passage: ",
+        max_length: int = 512,
+        max_batch_size: int = 32,
+        batch_wait_ms: float = 5.0,
+        ingest_batch_size: int = 256,
+        cache_size: int = 10_000,
+        num_threads: Optional[int] = None,
+    ):
+        """
+        :param onnx_file_name: Готовый ONNX-файл в репозитории модели, например
+            "onnx/model_qint8_avx512_vnni.onnx". Без него модель экспортируется в ONNX при загрузке.
+        :param max_batch_size: Максимальный микропакет запросов.
+        :param batch_wait_ms: Сколько первый запрос пакета ждёт попутчиков.
+        :param ingest_batch_size: Размер пакета при загрузке документов.
+        """
+        self.model_name = model_name
+        self.onnx_file_name = onnx_file_name
+        self.query_prefix = query_prefix
+        self.passage_prefix = passage_prefix
+        self.max_length = max_length
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.ingest_batch_size = ingest_batch_size
+        self.num_threads = num_threads
+        self.model = None
+        self.tokenizer = None
+        self._load_lock = threading.Lock()
+        # Эмбеддинг запроса не устаревает, поэтому кэш ограничен только размером
+        self._query_cache = TTLCache(maxsize=cache_size, ttl=float("inf"))
+        self._pending: Dict[str, "asyncio.Future[List[float]]"] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._batch_tasks: Set["asyncio.Task[None]"] = set()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.model is not None
+
+    def load(self) -> None:
+        """Загрузка токенизатора и ONNX-модели. Потокобезопасна и выполняется один раз."""
+        with self._load_lock:
+            if self.is_loaded:
+                return
+            logging.info(f"Загрузка модели эмбеддингов {self.model_name}...")
+            started_at = time.perf_counter()
+            import onnxruntime  # type: ignore
+            from optimum.onnxruntime import ORTModelForFeatureExtraction  # type: ignore
+            from transformers import AutoTokenizer  # type: ignore
+
+            session_options = onnxruntime.SessionOptions()
+            if self.num_threads:
+                session_options.intra_op_num_threads = self.num_threads
+            if self.onnx_file_name:
+                model = ORTModelForFeatureExtraction.from_pretrained(
+                    self.model_name, file_name=self.onnx_file_name, session_options=session_options
+                )
+            else:
+                model = ORTModelForFeatureExtraction.from_pretrained(
+                    self.model_name, export=True, session_options=session_options
+                )
+            # tokenizer выставляется раньше model: is_loaded смотрит на model
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            self.model = model
+            logging.info(f"Модель эмбеддингов загружена за {time.perf_counter() - started_at:.1f}s.")
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Нормализованные эмбеддинги (mean pooling) одним прогоном модели."""
+        self.load()
+        inputs = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+        )
+        hidden = self.model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"][..., None].astype(hidden.dtype)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.linalg.norm(pooled, axis=1, keepdims=True)
+
+    def embed_documents(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        """Эмбеддинги фрагментов документов крупными пакетами; вызывать вне event loop."""
+        batch_size = batch_size or self.ingest_batch_size
+        # Похожие по длине тексты в одном пакете — меньше паддинга
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        result = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            vectors = self.encode([self.passage_prefix + texts[i] for i in indices])
+            if not result.shape[1]:
+                result = np.empty((len(texts), vectors.shape[1]), dtype=vectors.dtype)
+            result[indices] = vectors
+        return result
+
+    async def embed_query(self, text: str) -> List[float]:
+        """Эмбеддинг запроса: из кэша или в общем микропакете с запросами других обработчиков."""
+        cached = self._query_cache.get(text)
+        if cached is not MISSING:
+            return cached
+        future = self._pending.get(text)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[text] = loop.create_future()
+            if len(self._pending) >= self.max_batch_size:
+                self._flush(loop)
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.batch_wait, self._flush, loop)
+        return await asyncio.shield(future)
+
+    def _flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = loop.create_task(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch: Dict[str, "asyncio.Future[List[float]]"]) -> None:
+        texts = list(batch)
+        error: Exception = RuntimeError("Пакет эмбеддингов отменён")
+        try:
+            vectors = await asyncio.to_thread(self.encode, [self.query_prefix + text for text in texts])
+            for text, vector in zip(texts, vectors):
+                vector = vector.tolist()
+                self._query_cache.set(text, vector)
+                batch[text].set_result(vector)
+        except Exception as e:
+            error = e
+        finally:
+            # В том числе при отмене задачи пакета: ждущие обработчики не должны зависнуть
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(error)
+
+
+def table_embedding_model(table: Any) -> Optional[str]:
+    """Модель, которой ingest.py посчитал векторы таблицы LanceDB, или None для других таблиц."""
+    model = (table.schema.metadata or {}).get(EMBEDDING_MODEL_KEY)
+    return model.decode("utf-8") if model is not None else None
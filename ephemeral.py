@@ -0,0 +1,106 @@
+import abc
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+
+class EphemeralStore(abc.ABC):
+    """Хранилище ключ-значение с временем жизни ключей для временных данных чатов."""
+
+    def __init__(self, default_ttl: float = 86400.0):
+        self.default_ttl = default_ttl
+
+    @abc.abstractmethod
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+
+class InMemoryEphemeralStore(EphemeralStore):
+    """
+    Хранилище в памяти процесса. Просроченные ключи удаляются при чтении
+    и периодической очисткой, которая запускается не чаще раза в gc_interval секунд.
+
+    Подходит для одного процесса и для многопроцессного режима ShardedRunner, где все
+    обновления чата попадают в один воркер. Несколько экземпляров за балансировщиком
+    должны использовать RedisEphemeralStore: подтверждение /solve может прийти в другой экземпляр.
+    """
+
+    def __init__(self, default_ttl: float = 86400.0, gc_interval: float = 60.0):
+        super().__init__(default_ttl)
+        self.gc_interval = gc_interval
+        self._data: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+        self._last_gc = time.monotonic()
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (now + (ttl or self.default_ttl), value)
+        if now - self._last_gc >= self.gc_interval:
+            self.collect_garbage()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def collect_garbage(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._data.items() if expires_at < now]
+            for key in expired:
+                del self._data[key]
+            self._last_gc = now
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisEphemeralStore(EphemeralStore):
+    """
+    Хранилище в Redis (или совместимом сервере); истечение ключей выполняет сам сервер.
+    Принимает любой клиент с методами set(name, value, ex=...), get и delete,
+    поэтому в тестах его легко подменить.
+    """
+
+    def __init__(self, client: Any, default_ttl: float = 86400.0, prefix: str = "rag_math:temp:"):
+        super().__init__(default_ttl)
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> "RedisEphemeralStore":
+        import redis  # type: ignore
+
+        return cls(redis.Redis.from_url(url, decode_responses=True), **kwargs)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self.client.set(self.prefix + key, value, ex=max(1, int(ttl or self.default_ttl)))
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(self.prefix + key)
+        if isinstance(value, bytes):
+            return value.decode("utf-8")
+        return value
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
@@ -0,0 +1,145 @@
+"""
+Потоковая выгрузка истории для офлайн-оценки качества ответов.
+
+Таблицы читаются страницами по первичному ключу (keyset: WHERE id > последний id),
+каждая страница идёт через серверный курсор и отдаётся пачками Arrow RecordBatch,
+поэтому память не растёт с размером таблиц.
+
+Запуск:
+    python export.py --db_url=sqlite:///db.sqlite --output_dir=exports
+"""
+import logging
+import os
+from typing import Any, Callable, Iterator, Sequence
+
+import fire  # type: ignore
+from sqlalchemy import Select, and_, select
+
+from archive import conversation_schema, message_schema
+from database import Conversation, Database, Like, Message
+
+
+def feedback_schema() -> Any:
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.int64()),
+        ("user_id", pa.int64()),
+        ("message_id", pa.int64()),
+        ("feedback", pa.string()),
+        ("is_correct", pa.int64()),
+    ])
+
+
+def message_feedback_schema() -> Any:
+    import pyarrow as pa
+
+    return pa.schema(list(message_schema()) + [
+        pa.field("like_id", pa.int64()),
+        pa.field("feedback", pa.string()),
+        pa.field("is_correct", pa.int64()),
+    ])
+
+
+def _keyset_batches(
+    db: Database,
+    page: Callable[[int], Select],
+    schema: Any,
+    batch_size: int,
+    page_size: int,
+) -> Iterator[Any]:
+    """page(last_id) строит запрос страницы; первая колонка запроса — ключ пагинации."""
+    import pyarrow as pa
+
+    names = schema.names
+    last_id = 0
+    while True:
+        fetched = 0
+        with db.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(page(last_id))
+            for rows in result.partitions():
+                fetched += len(rows)
+                last_id = rows[-1][0]
+                yield pa.RecordBatch.from_arrays(
+                    [pa.array([row[i] for row in rows], type=schema.field(i).type) for i in range(len(names))],
+                    schema=schema,
+                )
+        if fetched < page_size:
+            return
+
+
+def iter_conversations(db: Database, batch_size: int = 10_000, page_size: int = 100_000) -> Iterator[Any]:
+    columns = [Conversation.id, Conversation.user_id, Conversation.conv_id, Conversation.timestamp]
+    return _keyset_batches(
+        db,
+        lambda last_id: select(*columns).where(Conversation.id > last_id).order_by(Conversation.id).limit(page_size),
+        conversation_schema(),
+        batch_size,
+        page_size,
+    )
+
+
+def iter_messages(db: Database, batch_size: int = 10_000, page_size: int = 100_000) -> Iterator[Any]:
+    """Сообщения с оценками: ответ ассистента соединяется с лайком по message_id и пользователю."""
+    columns = [
+        Message.id, Message.role, Message.user_id, Message.user_name, Message.reply_user_id, Message.content,
+        Message.conv_id, Message.timestamp, Message.message_id, Message.system_prompt, Message.rag_promt,
+        Like.id, Like.feedback, Like.is_correct,
+    ]
+
+    def page(last_id: int) -> Select:
+        # Страница ограничивается по сообщениям, чтобы несколько оценок одного ответа не разрывались
+        page_ids = select(Message.id).where(Message.id > last_id).order_by(Message.id).limit(page_size)
+        return (
+            select(*columns)
+            .outerjoin(Like, and_(Like.message_id == Message.message_id, Like.user_id == Message.reply_user_id))
+            .where(Message.id.in_(page_ids))
+            .order_by(Message.id, Like.id)
+        )
+
+    return _keyset_batches(db, page, message_feedback_schema(), batch_size, page_size)
+
+
+def iter_feedback(db: Database, batch_size: int = 10_000, page_size: int = 100_000) -> Iterator[Any]:
+    columns = [Like.id, Like.user_id, Like.message_id, Like.feedback, Like.is_correct]
+    return _keyset_batches(
+        db,
+        lambda last_id: select(*columns).where(Like.id > last_id).order_by(Like.id).limit(page_size),
+        feedback_schema(),
+        batch_size,
+        page_size,
+    )
+
+
+EXPORTS = {
+    "conversations": (iter_conversations, conversation_schema),
+    "messages": (iter_messages, message_feedback_schema),
+    "feedback": (iter_feedback, feedback_schema),
+}
+
+
+def export(
+    db_url: str,
+    output_dir: str = "exports",
+    tables: Sequence[str] = ("conversations", "messages", "feedback"),
+    batch_size: int = 10_000,
+    page_size: int = 100_000,
+) -> None:
+    import pyarrow.parquet as pq
+
+    db = Database(db_url)
+    os.makedirs(output_dir, exist_ok=True)
+    for table_name in tables:
+        iterate, schema = EXPORTS[table_name]
+        path = os.path.join(output_dir, f"{table_name}.parquet")
+        rows = 0
+        with pq.ParquetWriter(path, schema(), compression="zstd") as writer:
+            for batch in iterate(db, batch_size=batch_size, page_size=page_size):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        logging.info(f"{table_name}: выгружено {rows} строк в {path}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    fire.Fire(export)
@@ -0,0 +1,119 @@
+"""
+Загрузка документов в таблицу предмета LanceDB с эмбеддингами от EmbeddingService.
+
+Запуск:
+    python ingest.py --db_vector_path=lancedb --table_name=algebra --paths=docs/algebra \\
+        --model_name=intfloat/multilingual-e5-small
+"""
+import logging
+import os
+import time
+from typing import Iterator, List, Optional, Sequence, Union
+
+import fire  # type: ignore
+
+from document_loader import DocumentLoader
+from embeddings import EMBEDDING_MODEL_KEY, EmbeddingService, table_embedding_model
+
+
+def split_text(text: str, chunk_chars: int = 1000, overlap_chars: int = 200) -> List[str]:
+    """Фрагменты по абзацам не длиннее chunk_chars; слишком длинные абзацы режутся с перекрытием."""
+    chunks: List[str] = []
+    current = ""
+    for paragraph in (p.strip() for p in text.split("\n\n")):
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 2 <= chunk_chars:
+            current += "\n\n" + paragraph
+            continue
+        if current:
+            chunks.append(current)
+        step = max(1, chunk_chars - overlap_chars)
+        while len(paragraph) > chunk_chars:
+            chunks.append(paragraph[:chunk_chars])
+            paragraph = paragraph[step:]
+        current = paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def iter_files(paths: Sequence[str], loader: DocumentLoader) -> Iterator[str]:
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if loader.is_supported(os.path.splitext(name)[1].lower()):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def ingest(
+    db_vector_path: str,
+    table_name: str,
+    paths: Union[str, Sequence[str]],
+    model_name: str = "intfloat/multilingual-e5-small",
+    onnx_file_name: Optional[str] = None,
+    batch_size: int = 256,
+    chunk_chars: int = 1000,
+    overlap_chars: int = 200,
+    overwrite: bool = False,
+) -> None:
+    import lancedb
+    import pyarrow as pa
+
+    if isinstance(paths, str):
+        paths = [paths]
+    loader = DocumentLoader()
+    texts: List[str] = []
+    sources: List[str] = []
+    for path in iter_files(paths, loader):
+        with open(path, "rb") as r:
+            text = loader.load(r, os.path.splitext(path)[1].lower())
+        if not text:
+            logging.warning(f"Пропущен {path}: формат не поддерживается или текст пуст")
+            continue
+        chunks = split_text(text, chunk_chars, overlap_chars)
+        texts.extend(chunks)
+        sources.extend([path] * len(chunks))
+    if not texts:
+        logging.warning("Нет фрагментов для загрузки")
+        return
+
+    vectordb = lancedb.connect(db_vector_path)
+    append = not overwrite and table_name in vectordb.table_names()
+    if append:
+        # Векторы разных моделей в одной таблице несравнимы: проверяем до долгого подсчёта эмбеддингов
+        existing_model = table_embedding_model(vectordb.open_table(table_name))
+        if existing_model != model_name:
+            raise ValueError(
+                f"Векторы таблицы {table_name} посчитаны моделью {existing_model}, а не {model_name}; "
+                f"пересоздайте таблицу с --overwrite"
+            )
+
+    service = EmbeddingService(model_name=model_name, onnx_file_name=onnx_file_name, ingest_batch_size=batch_size)
+    started_at = time.perf_counter()
+    vectors = service.embed_documents(texts)
+    elapsed = time.perf_counter() - started_at
+    logging.info(f"{len(texts)} фрагментов за {elapsed:.1f}s ({len(texts) / elapsed:.1f} эмбеддингов/с)")
+
+    # Имя модели в метаданных схемы: бот сверяет его со своей моделью перед поиском
+    data = pa.table({
+        "text": texts,
+        "source": sources,
+        "vector": pa.FixedSizeListArray.from_arrays(pa.array(vectors.ravel()), vectors.shape[1]),
+    }).replace_schema_metadata({EMBEDDING_MODEL_KEY: model_name.encode("utf-8")})
+    if append:
+        table = vectordb.open_table(table_name)
+        table.add(data)
+    else:
+        table = vectordb.create_table(table_name, data=data, mode="overwrite")
+    # Гибридному поиску нужен полнотекстовый индекс; векторный строится при обслуживании таблиц
+    table.create_fts_index("text", replace=True)
+    logging.info(f"Таблица {table_name}: {table.count_rows()} строк")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    fire.Fire(ingest)
@@ -0,0 +1,92 @@
+"""
+Обслуживание таблиц LanceDB по предметам: компакция фрагментов, удаление старых версий
+и перестроение векторного и полнотекстового индексов, когда неиндексированных строк много.
+"""
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def _probe_vector(table: Any, vector_column: str) -> Optional[List[float]]:
+    """
+    Вектор пробного запроса. Таблица со встроенными функциями эмбеддингов LanceDB считает его
+    сама из текста (None); для таблиц ingest.py берётся вектор сохранённой строки:
+    бот эмбеддит запросы своей моделью, которой здесь нет.
+    """
+    from embeddings import LANCEDB_EMBEDDING_FUNCTIONS_KEY
+
+    if LANCEDB_EMBEDDING_FUNCTIONS_KEY in (table.schema.metadata or {}):
+        return None
+    rows = table.head(1)
+    return rows[vector_column][0].as_py() if rows.num_rows else None
+
+
+def _probe_latency(table: Any, query: str, vector: Optional[List[float]]) -> Optional[float]:
+    try:
+        started_at = time.perf_counter()
+        # Тот же гибридный запрос, что выполняет бот
+        if vector is None:
+            search = table.search(query, query_type="hybrid")
+        else:
+            search = table.search(query_type="hybrid").vector(vector).text(query)
+        search.limit(5).to_list()
+        return time.perf_counter() - started_at
+    except Exception as e:
+        logging.warning(f"Пробный запрос к {table.name} не выполнен: {e}")
+        return None
+
+
+def _format_latency(seconds: Optional[float]) -> str:
+    return "n/a" if seconds is None else f"{seconds * 1000:.0f}ms"
+
+
+def _needs_rebuild(table: Any, index: Any, threshold: int) -> bool:
+    stats = table.index_stats(index.name)
+    return stats is not None and stats.num_unindexed_rows >= threshold
+
+
+def maintain_table(
+    vectordb: Any,
+    table_name: str,
+    vector_column: str = "vector",
+    text_column: str = "text",
+    unindexed_threshold: int = 10_000,
+    prune_older_than: timedelta = timedelta(days=7),
+    probe_query: str = "уравнение",
+) -> Dict[str, Any]:
+    table = vectordb.open_table(table_name)
+    probe_vector = _probe_vector(table, vector_column)
+    before = _probe_latency(table, probe_query, probe_vector)
+
+    # Компакция мелких фрагментов от дозаписей и удаление версий старше prune_older_than
+    table.optimize(cleanup_older_than=prune_older_than)
+
+    indices = {tuple(index.columns): index for index in table.list_indices()}
+    rebuilt = []
+    vector_index = indices.get((vector_column,))
+    if vector_index is None or _needs_rebuild(table, vector_index, unindexed_threshold):
+        # IVF_PQ обучается на данных, на маленьких таблицах хватает полного перебора
+        if table.count_rows() >= 256:
+            table.create_index(metric="cosine", vector_column_name=vector_column, index_type="IVF_PQ", replace=True)
+            rebuilt.append("ivf_pq")
+    text_index = indices.get((text_column,))
+    if text_index is None or _needs_rebuild(table, text_index, unindexed_threshold):
+        table.create_fts_index(text_column, replace=True)
+        rebuilt.append("fts")
+
+    after = _probe_latency(table, probe_query, probe_vector)
+    result = {"table": table_name, "rebuilt": rebuilt, "before_s": before, "after_s": after}
+    logging.info(
+        f"Обслуживание {table_name}: перестроено {rebuilt or 'ничего'}, "
+        f"запрос {_format_latency(before)} -> {_format_latency(after)}"
+    )
+    return result
+
+
+def maintain_tables(vectordb: Any, table_names: Iterable[str], **kwargs: Any) -> None:
+    for table_name in table_names:
+        try:
+            maintain_table(vectordb, table_name, **kwargs)
+        except Exception as e:
+            logging.error(f"Ошибка при обслуживании таблицы {table_name}: {e}")
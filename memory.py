@@ -0,0 +1,77 @@
+"""
+Профилирование памяти процесса: RSS и снимки tracemalloc с крупнейшими аллокаторами
+и приростом относительно базового снимка.
+"""
+import os
+import sys
+import tracemalloc
+from typing import List, Optional
+
+# Собственные аллокации tracemalloc и импорт модулей только засоряют топ
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса; без /proc — пиковый RSS из getrusage."""
+    try:
+        with open("/proc/self/statm") as r:
+            return int(r.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _mb(size: float) -> str:
+    return f"{size / 2 ** 20:.1f} MB"
+
+
+class MemoryProfiler:
+    def __init__(self, frames: int = 10):
+        self.frames = frames
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def is_tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self) -> None:
+        """Включает tracemalloc и запоминает базовый снимок для сравнения."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self._baseline = self._snapshot()
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self._baseline = None
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+    def report(self, limit: int = 10, key_type: str = "lineno") -> str:
+        lines: List[str] = [f"RSS: {_mb(rss_bytes())}"]
+        if not tracemalloc.is_tracing():
+            lines.append("tracemalloc выключен, включить: /memory start")
+            return "\n".join(lines)
+        current, peak = tracemalloc.get_traced_memory()
+        lines.append(f"Python heap: {_mb(current)} (пик {_mb(peak)}), накладные tracemalloc {_mb(tracemalloc.get_tracemalloc_memory())}")
+
+        snapshot = self._snapshot()
+        lines.append("")
+        lines.append(f"Топ-{limit} аллокаторов:")
+        for stat in snapshot.statistics(key_type)[:limit]:
+            lines.append(f"{_mb(stat.size)} в {stat.count} блоках — {stat.traceback[0]}")
+
+        if self._baseline is not None:
+            growth = [stat for stat in snapshot.compare_to(self._baseline, key_type) if stat.size_diff > 0][:limit]
+            lines.append("")
+            lines.append(f"Прирост с базового снимка ({sum(s.size_diff for s in growth) / 2 ** 20:+.1f} MB в топе):")
+            for stat in growth:
+                lines.append(f"{stat.size_diff / 2 ** 20:+.2f} MB ({stat.count_diff:+d} блоков) — {stat.traceback[0]}")
+        return "\n".join(lines)
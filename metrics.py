@@ -0,0 +1,46 @@
+"""
+Минимальный реестр метрик процесса: счётчики и gauge с метками,
+снимок которых можно отдать в лог или в HTTP-эндпоинт.
+"""
+import threading
+from typing import Dict, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Labels]:
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def get(self, name: str, **labels: str) -> float:
+        key = self._key(name, labels)
+        with self._lock:
+            return self._counters.get(key, self._gauges.get(key, 0.0))
+
+    def snapshot(self) -> Dict[str, float]:
+        """Плоский словарь вида {'name{label="value"}': число}."""
+        with self._lock:
+            items = list(self._counters.items()) + list(self._gauges.items())
+        result = {}
+        for (name, labels), value in items:
+            suffix = ",".join(f'{k}="{v}"' for k, v in labels)
+            result[f"{name}{{{suffix}}}" if suffix else name] = value
+        return result
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,104 @@
+import logging
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, Integer, MetaData, Table, inspect, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+
+
+version_metadata = MetaData()
+
+# Единственная строка с id = 1: параллельный старт не может вставить вторую
+SCHEMA_VERSION_ID = 1
+
+schema_version = Table(
+    "schema_version",
+    version_metadata,
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("version", Integer, nullable=False),
+)
+
+_INSERTS_IGNORING_CONFLICTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _add_lookup_indexes(conn: Connection) -> None:
+    # Дубликаты (chat_id, key) мешают построить уникальный индекс: оставляем последнюю запись
+    conn.execute(text(
+        "DELETE FROM temp_data WHERE id NOT IN "
+        "(SELECT MAX(id) FROM temp_data GROUP BY chat_id, key)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_current_conversations_user_id_timestamp "
+        "ON current_conversations (user_id, timestamp, id)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_messages_conv_id_timestamp_id "
+        "ON messages (conv_id, timestamp, id)"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_messages_user_name ON messages (user_name)"))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_temp_data_chat_id_key ON temp_data (chat_id, key)"
+    ))
+    # Одиночные индексы стали префиксами составных и только замедляют вставку
+    conn.execute(text("DROP INDEX IF EXISTS ix_current_conversations_user_id"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_messages_conv_id"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_temp_data_chat_id"))
+
+
+def _purge_temp_data(conn: Connection) -> None:
+    # Временные данные переехали в EphemeralStore, старые записи больше никто не читает
+    conn.execute(text("DELETE FROM temp_data"))
+
+
+# Миграции применяются строго по порядку; номер версии никогда не переиспользуется.
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "composite lookup indexes", _add_lookup_indexes),
+    (2, "purge temp_data moved to ephemeral store", _purge_temp_data),
+]
+
+
+def _upgrade_version_table(conn: Connection) -> None:
+    """Таблица версии без первичного ключа (до одиночной строки) пересоздаётся с наибольшей версией."""
+    columns = {column["name"] for column in inspect(conn).get_columns(schema_version.name)}
+    if "id" in columns:
+        return
+    current = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    schema_version.drop(conn)
+    schema_version.create(conn)
+    conn.execute(schema_version.insert().values(id=SCHEMA_VERSION_ID, version=current))
+
+
+def _insert_initial_version(conn: Connection) -> None:
+    dialect_insert = _INSERTS_IGNORING_CONFLICTS.get(conn.dialect.name)
+    if dialect_insert is not None:
+        conn.execute(dialect_insert(schema_version).values(id=SCHEMA_VERSION_ID, version=0).on_conflict_do_nothing())
+        return
+    try:
+        with conn.begin_nested():
+            conn.execute(schema_version.insert().values(id=SCHEMA_VERSION_ID, version=0))
+    except IntegrityError:
+        pass
+
+
+def run_migrations(engine: Engine) -> int:
+    """
+    Применяет недостающие миграции поверх схемы, созданной create_all.
+    Каждая миграция выполняется в своей транзакции вместе с обновлением версии.
+    В многопроцессном режиме вызывается один раз во фронте до запуска воркеров.
+    """
+    version_metadata.create_all(engine)
+    with engine.begin() as conn:
+        _upgrade_version_table(conn)
+        _insert_initial_version(conn)
+        current = conn.execute(select(schema_version.c.version)).scalar_one()
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        logging.info(f"Применение миграции {version}: {description}")
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_version.update().values(version=version))
+        current = version
+    return current
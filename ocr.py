@@ -1,29 +1,120 @@
-from texify.inference import batch_inference
-from texify.model.model import load_model
-from texify.model.processor import load_processor
+import threading
+import time
+from typing import Optional
 from PIL import Image
 import logging
 MAX_WIDTH = 1980
 MAX_HEIGHT = 1080
+INFERENCE_MODES = ("default", "int8")
 class MathOCR:
-    def __init__(self):
+    def __init__(
+        self,
+        inference_mode: str = "default",
+        num_threads: Optional[int] = None,
+        num_interop_threads: Optional[int] = None,
+    ):
         """
-        Инициализация модели и процессора.
+        Модель и процессор загружаются лениво: при первом распознавании или через load().
+
+        :param inference_mode: "default" — веса как есть; "int8" — динамическая int8-квантизация
+            линейных слоёв для CPU.
+        :param num_threads: Число потоков внутри операций torch (intra-op).
+        :param num_interop_threads: Число потоков между операциями torch (inter-op).
+        """
+        assert inference_mode in INFERENCE_MODES, f"Неизвестный режим OCR: {inference_mode}"
+        self.inference_mode = inference_mode
+        self.num_threads = num_threads
+        self.num_interop_threads = num_interop_threads
+        self.model = None
+        self.processor = None
+        self._load_lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.model is not None
+
+    def load(self) -> None:
+        """
+        Загрузка модели и процессора. Потокобезопасна и выполняется один раз.
+        """
+        with self._load_lock:
+            if self.is_loaded:
+                return
+            try:
+                logging.info(f"Загрузка модели и процессора для OCR (режим {self.inference_mode})...")
+                started_at = time.perf_counter()
+                import torch
+                from texify.model.model import load_model
+                from texify.model.processor import load_processor
+                imported_at = time.perf_counter()
+                self._configure_threads(torch)
+                # processor выставляется раньше model: is_loaded смотрит на model
+                self.processor = load_processor()
+                if self.inference_mode == "int8":
+                    # Квантизация работает только с float32 на CPU
+                    model = load_model(device="cpu", dtype=torch.float32)
+                    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                else:
+                    model = load_model()
+                model.eval()
+                self.model = model
+                logging.info(
+                    f"Модель и процессор успешно загружены "
+                    f"(импорт {imported_at - started_at:.1f}s, загрузка {time.perf_counter() - imported_at:.1f}s)."
+                )
+            except Exception as e:
+                logging.error(f"Ошибка при инициализации MathOCR: {e}")
+                raise RuntimeError("Не удалось загрузить модель OCR.")
+
+    def _configure_threads(self, torch) -> None:
+        # Несколько процессов бота на одном хосте иначе занимают все ядра каждый
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        if self.num_interop_threads:
+            try:
+                torch.set_num_interop_threads(self.num_interop_threads)
+            except RuntimeError as e:
+                # torch разрешает менять inter-op потоки только до первой параллельной операции
+                logging.warning(f"Не удалось задать число inter-op потоков: {e}")
+
+    def infer_images(self, pil_images, temperature, batch_size: int = 8):
+        """
+        Пакетное распознавание нескольких изображений за один проход модели.
         """
-        try:
-            logging.info("Загрузка модели и процессора для OCR...")
-            self.model = load_model()
-            self.processor = load_processor()
-            logging.info("Модель и процессор успешно загружены.")
-        except Exception as e:
-            logging.error(f"Ошибка при инициализации MathOCR: {e}")
-            raise RuntimeError("Не удалось загрузить модель OCR.")
+        import torch
+        from texify.inference import batch_inference
 
-    def infer_image(self, pil_image, temperature, type_ocr = 'texify') :
+        self.load()
+        outputs = []
+        for pil_image in pil_images:
             pil_image.thumbnail((MAX_WIDTH, MAX_HEIGHT), Image.LANCZOS)
-            input_img = pil_image
+        with torch.inference_mode():
+            for start in range(0, len(pil_images), batch_size):
+                batch = pil_images[start:start + batch_size]
+                outputs.extend(batch_inference(batch, self.model, self.processor, temperature=temperature))
+        return outputs
+
+    def infer_pages(self, pil_images, temperature, detect_regions: bool = False):
+        """
+        Распознаёт несколько фото за один пакетный проход. Для каждого фото возвращает
+        строки с формулами, разделённые переводом строки.
+        """
+        if detect_regions:
+            from ocr_regions import detect_formula_regions
+
+            # Распознаём только строки с формулами, а не фон страницы
+            pages = [detect_formula_regions(pil_image) for pil_image in pil_images]
+        else:
+            pages = [[pil_image] for pil_image in pil_images]
+        outputs = iter(self.infer_images([crop for page in pages for crop in page], temperature))
+        results = []
+        for page in pages:
+            lines = [next(outputs).strip() for _ in page]
+            results.append("\n".join(line for line in lines if line))
+        return results
+
+    def infer_image(self, pil_image, temperature, type_ocr = 'texify', detect_regions: bool = False) :
             if  type_ocr == 'texify':
-                model_output = batch_inference([input_img], self.model, self.processor, temperature=temperature)
-                return model_output[0]
+                return self.infer_pages([pil_image], temperature, detect_regions=detect_regions)[0]
             elif type_ocr == 'vllm':
                 pass
@@ -0,0 +1,173 @@
+"""
+Поиск областей с формулами на фото перед OCR: нормализация фона, бинаризация Оцу,
+выравнивание наклона по профилю проекций и связные компоненты по «размазанным» строкам.
+"""
+import logging
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter, ImageOps
+
+Box = Tuple[int, int, int, int]
+
+ANALYSIS_SIZE = 1000
+MAX_SKEW_DEGREES = 10.0
+SKEW_STEP_DEGREES = 0.5
+MAX_REGIONS = 12
+
+
+def _otsu_threshold(gray: np.ndarray) -> int:
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = gray.size
+    cumulative = np.cumsum(hist)
+    cumulative_mean = np.cumsum(hist * np.arange(256))
+    background = cumulative[:-1]
+    foreground = total - background
+    valid = (background > 0) & (foreground > 0)
+    mean_background = np.where(valid, cumulative_mean[:-1] / np.maximum(background, 1), 0)
+    mean_foreground = np.where(
+        valid, (cumulative_mean[-1] - cumulative_mean[:-1]) / np.maximum(foreground, 1), 0
+    )
+    between = background * foreground * (mean_background - mean_foreground) ** 2
+    return int(np.argmax(np.where(valid, between, -1)))
+
+
+def _binarize(gray: Image.Image) -> np.ndarray:
+    """Маска «чернил»: фон выравнивается делением на размытую копию, затем порог Оцу."""
+    background = gray.filter(ImageFilter.GaussianBlur(radius=max(gray.size) / 40))
+    pixels = np.asarray(gray, dtype=np.float32)
+    normalized = np.clip(pixels / np.maximum(np.asarray(background, dtype=np.float32), 1) * 255, 0, 255)
+    normalized = normalized.astype(np.uint8)
+    return normalized < _otsu_threshold(normalized)
+
+
+def _estimate_skew(ink: np.ndarray) -> float:
+    """Угол, при котором горизонтальный профиль проекций самый «контрастный»."""
+    if not ink.any():
+        return 0.0
+    image = Image.fromarray(ink.astype(np.uint8) * 255)
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-MAX_SKEW_DEGREES, MAX_SKEW_DEGREES + 1e-6, SKEW_STEP_DEGREES):
+        profile = np.asarray(image.rotate(angle, resample=Image.NEAREST)).sum(axis=1, dtype=np.float64)
+        score = float(np.var(profile))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def _dilate(mask: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Прямоугольная дилатация через скользящую сумму по строкам и столбцам."""
+    def along(axis_mask: np.ndarray, size: int, axis: int) -> np.ndarray:
+        if size <= 1:
+            return axis_mask
+        pad = [(0, 0), (0, 0)]
+        pad[axis] = (size // 2 + 1, size - size // 2 - 1)
+        cumulative = np.cumsum(np.pad(axis_mask.astype(np.int32), pad), axis=axis)
+        if axis == 1:
+            return (cumulative[:, size:] - cumulative[:, :-size]) > 0
+        return (cumulative[size:, :] - cumulative[:-size, :]) > 0
+
+    return along(along(mask, width, 1), height, 0)
+
+
+def _connected_components(mask: np.ndarray) -> List[Box]:
+    """Связные компоненты (8-связность) по сериям пикселей в строках; возвращает рамки."""
+    parent: List[int] = []
+
+    def find(label: int) -> int:
+        while parent[label] != label:
+            parent[label] = parent[parent[label]]
+            label = parent[label]
+        return label
+
+    runs: List[Tuple[int, int, int, int]] = []
+    previous: List[Tuple[int, int, int]] = []
+    for y, row in enumerate(mask):
+        edges = np.diff(np.concatenate(([0], row.astype(np.int8), [0])))
+        current = []
+        for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+            label = -1
+            for prev_start, prev_end, prev_label in previous:
+                if prev_start <= end and prev_end >= start:
+                    root = find(prev_label)
+                    if label == -1:
+                        label = root
+                    elif root != label:
+                        parent[root] = label
+            if label == -1:
+                label = len(parent)
+                parent.append(label)
+            current.append((int(start), int(end), label))
+            runs.append((y, int(start), int(end), label))
+        previous = current
+
+    boxes: dict = {}
+    for y, start, end, label in runs:
+        root = find(label)
+        left, top, right, bottom = boxes.get(root, (start, y, end, y + 1))
+        boxes[root] = (min(left, start), min(top, y), max(right, end), max(bottom, y + 1))
+    return list(boxes.values())
+
+
+def _merge_overlapping(boxes: List[Box], margin: int) -> List[Box]:
+    merged = True
+    while merged:
+        merged = False
+        result: List[Box] = []
+        for box in boxes:
+            for i, other in enumerate(result):
+                if (box[0] - margin < other[2] and other[0] - margin < box[2]
+                        and box[1] - margin < other[3] and other[1] - margin < box[3]):
+                    result[i] = (min(box[0], other[0]), min(box[1], other[1]),
+                                 max(box[2], other[2]), max(box[3], other[3]))
+                    merged = True
+                    break
+            else:
+                result.append(box)
+        boxes = result
+    return boxes
+
+
+def detect_formula_regions(image: Image.Image, padding: float = 0.02) -> List[Image.Image]:
+    """
+    Возвращает выровненные вырезки строк с формулами сверху вниз.
+    Если отделить строки не удалось или их больше MAX_REGIONS, возвращает изображение целиком.
+    """
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    scale = min(1.0, ANALYSIS_SIZE / max(image.size))
+    small = image.convert("L").resize(
+        (max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.BILINEAR
+    )
+
+    angle = _estimate_skew(_binarize(small))
+    if angle:
+        image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=(255, 255, 255))
+        small = small.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    ink = _binarize(small)
+
+    height, width = ink.shape
+    smeared = _dilate(ink, width=max(3, width // 25), height=max(3, height // 60))
+    boxes = [
+        box for box in _connected_components(smeared)
+        if box[3] - box[1] >= max(8, height // 80) and (box[2] - box[0]) * (box[3] - box[1]) >= ink.size // 1000
+    ]
+    boxes = _merge_overlapping(boxes, margin=max(2, height // 200))
+    if not boxes:
+        return [image]
+    if len(boxes) > MAX_REGIONS:
+        # Лишние строки нельзя просто отбросить: пользователь увидел бы неполное распознавание
+        logging.warning(f"Найдено {len(boxes)} строк при пределе {MAX_REGIONS}, распознаём страницу целиком")
+        return [image]
+    boxes.sort(key=lambda box: (box[1], box[0]))
+
+    crops = []
+    pad_x, pad_y = int(padding * width), int(padding * height)
+    for left, top, right, bottom in boxes:
+        crop_box = (
+            int(max(0, left - pad_x) / scale),
+            int(max(0, top - pad_y) / scale),
+            int(min(width, right + pad_x) / scale),
+            int(min(height, bottom + pad_y) / scale),
+        )
+        crops.append(image.crop(crop_box))
+    return crops
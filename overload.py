@@ -0,0 +1,134 @@
+"""
+Защита от перегрузки: по задержке event loop и числу запросов в работе у LLM и OCR
+бот ступенчато отключает дорогие части обработки и возвращает их, когда нагрузка спадает.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import AsyncIterator, Dict, Optional, Sequence
+
+from metrics import REGISTRY, MetricsRegistry
+
+
+class Mode(IntEnum):
+    NORMAL = 0
+    NO_RERANK = 1
+    NO_VERIFICATION = 2
+    SHORT_HISTORY = 3
+    REJECT_SOLVE = 4
+
+
+class OverloadController:
+    """
+    Давление — наибольшее из отношений loop lag, LLM и OCR в работе к своим порогам.
+    Режим сразу поднимается до ступени, соответствующей давлению (stage_pressures),
+    а опускается на одну ступень, только если давление recover_samples замеров подряд
+    ниже recover_ratio от порога текущей ступени.
+    """
+
+    def __init__(
+        self,
+        max_loop_lag_ms: float = 200.0,
+        max_llm_inflight: int = 8,
+        max_ocr_inflight: int = 4,
+        check_interval_ms: float = 500.0,
+        stage_pressures: Sequence[float] = (1.0, 1.5, 2.0, 3.0),
+        recover_ratio: float = 0.7,
+        recover_samples: int = 10,
+        metrics: MetricsRegistry = REGISTRY,
+    ):
+        assert len(stage_pressures) == len(Mode) - 1
+        self.limits = {"loop_lag_ms": max_loop_lag_ms, "llm": max_llm_inflight, "ocr": max_ocr_inflight}
+        self.check_interval = check_interval_ms / 1000
+        self.stage_pressures = list(stage_pressures)
+        self.recover_ratio = recover_ratio
+        self.recover_samples = recover_samples
+        self.metrics = metrics
+        self.mode = Mode.NORMAL
+        self.inflight: Dict[str, int] = {"llm": 0, "ocr": 0}
+        self.loop_lag_ms = 0.0
+        self._calm_samples = 0
+        self._task: Optional[asyncio.Task] = None
+        self.metrics.set("overload_mode", int(self.mode))
+
+    @property
+    def skip_rerank(self) -> bool:
+        return self.mode >= Mode.NO_RERANK
+
+    @property
+    def skip_verification(self) -> bool:
+        return self.mode >= Mode.NO_VERIFICATION
+
+    @property
+    def shrink_history(self) -> bool:
+        return self.mode >= Mode.SHORT_HISTORY
+
+    @property
+    def reject_solve(self) -> bool:
+        return self.mode >= Mode.REJECT_SOLVE
+
+    @asynccontextmanager
+    async def track(self, kind: str) -> AsyncIterator[None]:
+        """Учитывает запрос к LLM или OCR как находящийся в работе."""
+        self.inflight[kind] += 1
+        self.metrics.set("overload_inflight", self.inflight[kind], kind=kind)
+        try:
+            yield
+        finally:
+            self.inflight[kind] -= 1
+            self.metrics.set("overload_inflight", self.inflight[kind], kind=kind)
+
+    def pressure(self) -> float:
+        return max(
+            self.loop_lag_ms / self.limits["loop_lag_ms"],
+            self.inflight["llm"] / self.limits["llm"],
+            self.inflight["ocr"] / self.limits["ocr"],
+        )
+
+    def update(self, pressure: float) -> Mode:
+        target = Mode(sum(pressure >= threshold for threshold in self.stage_pressures))
+        if target > self.mode:
+            self._calm_samples = 0
+            self._set_mode(target, pressure)
+        elif self.mode > Mode.NORMAL and pressure < self.stage_pressures[self.mode - 1] * self.recover_ratio:
+            self._calm_samples += 1
+            if self._calm_samples >= self.recover_samples:
+                self._calm_samples = 0
+                self._set_mode(Mode(self.mode - 1), pressure)
+        else:
+            self._calm_samples = 0
+        return self.mode
+
+    def _set_mode(self, mode: Mode, pressure: float) -> None:
+        previous, self.mode = self.mode, mode
+        self.metrics.set("overload_mode", int(mode))
+        self.metrics.inc("overload_mode_changes", from_mode=previous.name, to_mode=mode.name)
+        log = logging.warning if mode > previous else logging.info
+        log(
+            f"Режим нагрузки {previous.name} -> {mode.name}: давление {pressure:.2f}, "
+            f"loop lag {self.loop_lag_ms:.0f}ms, LLM {self.inflight['llm']}, OCR {self.inflight['ocr']}"
+        )
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._monitor())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _monitor(self) -> None:
+        while True:
+            # Сон длиннее заказанного — это время, на которое loop был занят другими задачами
+            started_at = time.perf_counter()
+            await asyncio.sleep(self.check_interval)
+            self.loop_lag_ms = max(0.0, (time.perf_counter() - started_at - self.check_interval) * 1000)
+            self.metrics.set("overload_loop_lag_ms", self.loop_lag_ms)
+            self.update(self.pressure())
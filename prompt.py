@@ -0,0 +1,27 @@
+import copy
+from typing import Any, Dict, List
+
+ChatMessage = Dict[str, Any]
+ChatMessages = List[ChatMessage]
+
+
+def build_messages(system_prompt: str, messages: ChatMessages, merge_system: bool = True) -> ChatMessages:
+    """
+    Собирает запрос так, чтобы префикс (system + прошлые реплики) был побайтно одинаковым
+    от запроса к запросу и сервер модели мог переиспользовать KV-кэш: новое содержимое
+    только дописывается в конец. Входной список и его словари не изменяются.
+
+    :param system_prompt: Системный промпт; игнорируется, если первое сообщение уже system.
+    :param messages: История и новая реплика пользователя последней.
+    :param merge_system: Вклеивать system в первое сообщение — для моделей без роли system.
+    """
+    assert messages
+    messages = [copy.copy(m) for m in messages]
+    if messages[0]["role"] != "system" and system_prompt.strip():
+        messages.insert(0, {"role": "system", "content": system_prompt})
+
+    if merge_system and messages[0]["role"] == "system" and len(messages) > 1:
+        system_message = messages[0]["content"]
+        messages = messages[1:]
+        messages[0]["content"] = system_message + "\n\n" + messages[0]["content"]
+    return messages
@@ -1,9 +1,105 @@
 import copy
+from dataclasses import dataclass
 from typing import Dict, Any, Optional
 
+import httpx
 from openai import AsyncOpenAI
 
 
+@dataclass(frozen=True)
+class HttpClientConfig:
+    """Настройки пула соединений провайдера."""
+
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 60.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 120.0
+    write_timeout: float = 10.0
+    pool_timeout: float = 10.0
+    http2: bool = False
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout, read=self.read_timeout, write=self.write_timeout, pool=self.pool_timeout
+        )
+
+
+class CountingTransport(httpx.AsyncBaseTransport):
+    """
+    Транспорт с пулом соединений по HttpClientConfig, который считает запросы.
+    У httpx нет публичной статистики пула, поэтому она собирается на входе в транспорт.
+    """
+
+    def __init__(self, config: HttpClientConfig):
+        self.config = config
+        self.transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+            http2=config.http2,
+        )
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.in_flight += 1
+        self.requests += 1
+        try:
+            return await self.transport.handle_async_request(request)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+_http_clients: Dict[str, httpx.AsyncClient] = {}
+_http_transports: Dict[str, CountingTransport] = {}
+
+
+def shared_http_client(key: str, config: HttpClientConfig) -> httpx.AsyncClient:
+    """
+    Клиент с собственным пулом соединений для key (имя провайдера): лимиты одного провайдера
+    не делятся с другими. Повторный вызов с тем же key возвращает тот же клиент.
+    """
+    client = _http_clients.get(key)
+    if client is None or client.is_closed:
+        transport = _http_transports[key] = CountingTransport(config)
+        client = _http_clients[key] = httpx.AsyncClient(transport=transport, timeout=config.timeout)
+    return client
+
+
+def http_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    По провайдерам: лимит соединений, запросы в работе (в том числе ждущие соединение из пула),
+    всего запросов и ошибок транспорта с запуска.
+    """
+    return {
+        key: {
+            "max_connections": transport.config.max_connections,
+            "in_flight": transport.in_flight,
+            "requests": transport.requests,
+            "errors": transport.errors,
+        }
+        for key, transport in _http_transports.items()
+    }
+
+
+async def close_http_clients() -> None:
+    for client in _http_clients.values():
+        await client.aclose()
+    _http_clients.clear()
+    _http_transports.clear()
+
+
 class LLMProvider:
     def __init__(
         self,
@@ -12,10 +108,43 @@ class LLMProvider:
         provider_name: str,
         model_name: str,
         system_prompt: str = "",
-        rag_prompt:str=""
+        rag_prompt:str="",
+        merge_system_prompt: bool = True,
+        cache_prompt: bool = False,
+        slot_count: int = 0,
+        request_timeout: float = 120.0,
+        http: Optional[Dict[str, Any]] = None,
     ):
+        """
+        :param request_timeout: Предельное время одной попытки запроса к модели, с.
+        :param http: Настройки HttpClientConfig: лимиты соединений, keep-alive, тайм-ауты, http2.
+        """
         self.provider_name = provider_name
         self.model_name = model_name
         self.system_prompt = system_prompt
         self.rag_prompt = rag_prompt
-        self.api = AsyncOpenAI(base_url=base_url, api_key=api_key)
+        self.merge_system_prompt = merge_system_prompt
+        self.cache_prompt = cache_prompt
+        self.slot_count = slot_count
+        self.request_timeout = request_timeout
+        self.http_config = HttpClientConfig(**(http or {}))
+        # Повторы делает вызывающий код с собственным тайм-аутом попытки
+        self.api = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            http_client=shared_http_client(provider_name, self.http_config),
+            timeout=self.http_config.timeout,
+            max_retries=0,
+        )
+
+    def cache_hints(self, cache_key: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Параметры llama.cpp-совместимого сервера для переиспользования KV-кэша промпта.
+        """
+        extra_body: Dict[str, Any] = {}
+        if self.cache_prompt:
+            extra_body["cache_prompt"] = True
+        if self.slot_count and cache_key is not None:
+            # Чат закрепляется за слотом, в котором уже лежит его префикс
+            extra_body["id_slot"] = cache_key % self.slot_count
+        return extra_body
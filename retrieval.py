@@ -0,0 +1,116 @@
+"""
+Отбор найденных фрагментов для RAG: удаление почти одинаковых, переоценка слиянием
+порядка поиска с BM25 по запросу и адаптивный top-k в пределах бюджета токенов.
+"""
+import math
+import re
+from collections import Counter
+from typing import List, Set
+
+CHARS_PER_TOKEN = 3
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _shingles(tokens: List[str], size: int = 3) -> Set[tuple]:
+    if len(tokens) < size:
+        return {tuple(tokens)}
+    return {tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def dedupe_chunks(chunks: List[str], threshold: float = 0.85) -> List[str]:
+    """Убирает фрагменты, почти совпадающие (Жаккар по 3-граммам слов) с уже выбранными."""
+    kept: List[str] = []
+    kept_shingles: List[Set[tuple]] = []
+    for chunk in chunks:
+        shingles = _shingles(tokenize(chunk))
+        if any(len(shingles & other) / max(1, len(shingles | other)) >= threshold for other in kept_shingles):
+            continue
+        kept.append(chunk)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def bm25_scores(query: str, chunks: List[str], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """BM25 запроса по кандидатам; статистика документов считается по самому набору кандидатов."""
+    documents = [tokenize(chunk) for chunk in chunks]
+    if not documents:
+        return []
+    average_length = sum(len(doc) for doc in documents) / len(documents) or 1.0
+    document_frequency = Counter(term for doc in documents for term in set(doc))
+    query_terms = set(tokenize(query))
+    scores = []
+    for doc in documents:
+        frequencies = Counter(doc)
+        score = 0.0
+        for term in query_terms:
+            frequency = frequencies.get(term)
+            if not frequency:
+                continue
+            idf = math.log(1 + (len(documents) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            score += idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * len(doc) / average_length))
+        scores.append(score)
+    return scores
+
+
+def fused_scores(query: str, chunks: List[str], k: int = 10) -> List[float]:
+    """
+    Reciprocal rank fusion порядка поиска (кандидаты приходят уже ранжированными LanceDB) и BM25.
+    BM25 сравнивает точные словоформы, поэтому фрагмент без общих с запросом слов
+    теряет только свою долю BM25, но сохраняет вклад места в поиске.
+    Небольшое k под десяток кандидатов: хвост поиска без совпадений слов отсекается порогом.
+    """
+    bm25 = bm25_scores(query, chunks)
+    scores = [1 / (k + rank) for rank in range(1, len(chunks) + 1)]
+    lexical = sorted((i for i, score in enumerate(bm25) if score > 0), key=lambda i: -bm25[i])
+    for rank, i in enumerate(lexical, 1):
+        scores[i] += 1 / (k + rank)
+    return scores
+
+
+def select_context(
+    query: str,
+    chunks: List[str],
+    token_budget: int = 1200,
+    min_score_ratio: float = 0.3,
+    rerank: bool = True,
+) -> List[str]:
+    """
+    Возвращает фрагменты для промпта: без дублей, по убыванию слитой с BM25 релевантности,
+    пока укладываются в token_budget и набирают не меньше min_score_ratio от лучшего.
+    Лучший результат поиска проходит порог при min_score_ratio до 0.5 и без единого общего слова.
+    С rerank=False сохраняется порядок поиска и остаётся только обрезка по бюджету.
+    """
+    chunks = dedupe_chunks([chunk for chunk in chunks if chunk and chunk.strip()])
+    if not chunks:
+        return []
+    if rerank:
+        scores = fused_scores(query, chunks)
+        ranked = sorted(zip(scores, chunks), key=lambda item: -item[0])
+        top_score = ranked[0][0]
+        chunks = [chunk for score, chunk in ranked if not top_score or score >= top_score * min_score_ratio]
+
+    selected: List[str] = []
+    used = 0
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk)
+        if used + tokens > token_budget:
+            if not selected:
+                # Лучший фрагмент берём всегда, обрезая его до бюджета
+                selected.append(chunk[:token_budget * CHARS_PER_TOKEN])
+            break
+        selected.append(chunk)
+        used += tokens
+    return selected
+
+
+def format_context(chunks: List[str]) -> str:
+    return "\n\n".join(chunks)
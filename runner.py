@@ -0,0 +1,468 @@
+"""
+Горизонтальное масштабирование: N процессов-воркеров с LlmBot, общий OCR-сервис на хост
+и фронт, который раскладывает обновления Telegram по воркерам по хешу chat.id.
+Обновления одного чата всегда попадают в один воркер и обрабатываются по порядку.
+"""
+import abc
+import asyncio
+import hmac
+import itertools
+import json
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+Update = Dict[str, Any]
+
+# Поля обновления, в которых лежит сообщение с chat.id
+_MESSAGE_FIELDS = (
+    "message",
+    "edited_message",
+    "channel_post",
+    "edited_channel_post",
+    "business_message",
+    "edited_business_message",
+)
+
+
+def chat_id_of(update: Update) -> Optional[int]:
+    for field in _MESSAGE_FIELDS:
+        if field in update:
+            return update[field]["chat"]["id"]
+    callback = update.get("callback_query")
+    if callback:
+        if callback.get("message"):
+            return callback["message"]["chat"]["id"]
+        return callback["from"]["id"]
+    for field in ("inline_query", "chosen_inline_result", "pre_checkout_query", "shipping_query"):
+        if field in update:
+            return update[field]["from"]["id"]
+    return None
+
+
+def shard_of(update: Update, workers: int) -> int:
+    chat_id = chat_id_of(update)
+    key = chat_id if chat_id is not None else update.get("update_id", 0)
+    return key % workers
+
+
+class Transport(abc.ABC):
+    """Доставка обновлений от фронта к воркерам; None — сигнал завершить работу."""
+
+    @abc.abstractmethod
+    def send(self, worker: int, update: Optional[Update]) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def receive(self, worker: int) -> Optional[Update]:
+        ...
+
+
+class InProcessTransport(Transport):
+    """Транспорт в пределах одного event loop — для офлайн-проверки шардинга без процессов."""
+
+    def __init__(self, workers: int):
+        self.queues: List[asyncio.Queue] = [asyncio.Queue() for _ in range(workers)]
+
+    def send(self, worker: int, update: Optional[Update]) -> None:
+        self.queues[worker].put_nowait(update)
+
+    async def receive(self, worker: int) -> Optional[Update]:
+        return await self.queues[worker].get()
+
+
+class MultiprocessTransport(Transport):
+    def __init__(self, workers: int, context: Any):
+        self.queues = [context.Queue() for _ in range(workers)]
+
+    def send(self, worker: int, update: Optional[Update]) -> None:
+        self.queues[worker].put(update)
+
+    async def receive(self, worker: int) -> Optional[Update]:
+        return await asyncio.to_thread(self.queues[worker].get)
+
+
+async def consume(transport: Transport, worker: int, handle: Callable[[Update], Awaitable[Any]]) -> None:
+    """
+    Обрабатывает обновления воркера: разные чаты параллельно, один чат — строго по порядку.
+    После сигнала завершения дожидается всех начатых обработчиков.
+    """
+    tails: Dict[Any, asyncio.Task] = {}
+
+    async def run_after(previous: Optional[asyncio.Task], update: Update) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await handle(update)
+        except Exception:
+            logging.exception(f"Ошибка при обработке обновления {update.get('update_id')}")
+
+    def forget(key: Any, task: asyncio.Task) -> None:
+        if tails.get(key) is task:
+            del tails[key]
+
+    while (update := await transport.receive(worker)) is not None:
+        chat_id = chat_id_of(update)
+        key = chat_id if chat_id is not None else ("update", update.get("update_id"))
+        task = asyncio.create_task(run_after(tails.get(key), update))
+        tails[key] = task
+        task.add_done_callback(lambda t, key=key: forget(key, t))
+
+    if tails:
+        await asyncio.gather(*tails.values())
+
+
+def stop_on_exit(transport: Transport, worker: int) -> None:
+    """
+    Завершение воркера без команды фронта: по SIGTERM или если фронт умер. Воркер ставит None
+    в свою очередь и, как при обычной остановке, дожидается начатых обработчиков.
+    Повторный SIGTERM (terminate после drain_timeout) завершает процесс сразу.
+    """
+    loop = asyncio.get_running_loop()
+
+    def stop() -> None:
+        loop.remove_signal_handler(signal.SIGTERM)
+        transport.send(worker, None)
+
+    loop.add_signal_handler(signal.SIGTERM, stop)
+    _on_parent_exit(lambda: loop.call_soon_threadsafe(stop))
+
+
+def _on_parent_exit(callback: Callable[[], Any]) -> None:
+    parent = multiprocessing.parent_process()
+    if parent is None:
+        return
+
+    def watch() -> None:
+        parent.join()
+        logging.warning("Фронт завершился, останавливаемся")
+        try:
+            callback()
+        except RuntimeError:
+            # Event loop уже закрыт: процесс и так завершается
+            pass
+
+    threading.Thread(target=watch, name="parent-watch", daemon=True).start()
+
+
+# Идентификатор ответа, которым фронт сообщает воркеру, что OCR-сервис умер
+OCR_SERVICE_DIED = -1
+
+
+class RemoteMathOCR:
+    """
+    Клиент общего OCR-сервиса с интерфейсом MathOCR. Модель загружена один раз на хост,
+    воркеры отправляют изображения через очередь и ждут ответ в своей очереди.
+    """
+
+    def __init__(self, worker: int, requests: Any, responses: Any, timeout: float = 120.0):
+        """
+        :param timeout: Сколько ждать ответа сервиса; поток общего executor не должен висеть вечно.
+        """
+        self.worker = worker
+        self.requests = requests
+        self.responses = responses
+        self.timeout = timeout
+        self._ids = itertools.count()
+        self._pending: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._reader: Optional[threading.Thread] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return True
+
+    def load(self) -> None:
+        pass
+
+    def infer_pages(self, pil_images, temperature, detect_regions: bool = False) -> List[str]:
+        future: Future = Future()
+        with self._lock:
+            if self._reader is None:
+                self._reader = threading.Thread(target=self._read_responses, daemon=True)
+                self._reader.start()
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+        try:
+            self.requests.put((self.worker, request_id, list(pil_images), temperature, detect_regions))
+            return future.result(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+
+    def infer_image(self, pil_image, temperature, type_ocr='texify', detect_regions: bool = False):
+        return self.infer_pages([pil_image], temperature, detect_regions=detect_regions)[0]
+
+    def _read_responses(self) -> None:
+        while True:
+            request_id, result, error = self.responses.get()
+            with self._lock:
+                if request_id == OCR_SERVICE_DIED:
+                    futures = list(self._pending.values())
+                    self._pending.clear()
+                else:
+                    future = self._pending.pop(request_id, None)
+                    futures = [future] if future is not None else []
+            if not futures:
+                # Запрос уже отвалился по таймауту
+                logging.warning(f"Ответ OCR-сервиса на неизвестный запрос {request_id}")
+            for future in futures:
+                if error is not None:
+                    future.set_exception(RuntimeError(error))
+                else:
+                    future.set_result(result)
+
+
+def _ocr_service_main(requests: Any, responses: List[Any], ocr_kwargs: Dict[str, Any]) -> None:
+    from ocr import MathOCR
+
+    logging.basicConfig(level=logging.INFO)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Без фронта запросов больше не будет
+    _on_parent_exit(lambda: requests.put(None))
+    ocr = MathOCR(**ocr_kwargs)
+    ocr.load()
+    while (request := requests.get()) is not None:
+        # Запросы, накопившиеся от разных воркеров, распознаются одним пакетом
+        batch = [request]
+        while len(batch) < 16:
+            try:
+                request = requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                requests.put(None)
+                break
+            batch.append(request)
+
+        groups: Dict[Any, List[Any]] = {}
+        for item in batch:
+            groups.setdefault((item[3], item[4]), []).append(item)
+        for (temperature, detect_regions), items in groups.items():
+            try:
+                results = ocr.infer_pages(
+                    [image for item in items for image in item[2]], temperature, detect_regions=detect_regions
+                )
+                offset = 0
+                for worker, request_id, images, _, _ in items:
+                    responses[worker].put((request_id, results[offset:offset + len(images)], None))
+                    offset += len(images)
+            except Exception as e:
+                logging.exception("Ошибка OCR-сервиса")
+                for worker, request_id, *_ in items:
+                    responses[worker].put((request_id, None, str(e)))
+
+
+def _worker_main(
+    worker: int,
+    transport: Transport,
+    ocr_requests: Any,
+    ocr_responses: Any,
+    ocr_timeout: float,
+    bot_kwargs: Dict[str, Any],
+) -> None:
+    from bot import LlmBot
+
+    # Ctrl+C получает вся группа процессов; воркеров останавливает фронт, посылая None после слива очереди
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    bot = LlmBot(
+        **bot_kwargs,
+        ocr=RemoteMathOCR(worker, ocr_requests, ocr_responses, timeout=ocr_timeout),
+        # Схему уже подготовил фронт
+        migrate_db=False,
+    )
+    asyncio.run(bot.serve_shard(transport, worker))
+
+
+class ShardedRunner:
+    def __init__(
+        self,
+        bot_kwargs: Dict[str, Any],
+        workers: int = 2,
+        drain_timeout: float = 60.0,
+        max_restarts: int = 5,
+    ):
+        """
+        :param max_restarts: Сколько раз перезапускать упавший процесс, прежде чем остановить фронт.
+        """
+        from bot import BotConfig
+
+        with open(bot_kwargs["bot_config_path"]) as r:
+            self.config = BotConfig(**json.load(r))
+        self.bot_kwargs = bot_kwargs
+        self.workers = workers
+        self.drain_timeout = drain_timeout
+        self.max_restarts = max_restarts
+        self.processes: Dict[str, Any] = {}
+        self.restarts: Counter = Counter()
+
+    def run(self) -> None:
+        from database import migrate_database
+
+        # Один раз до запуска воркеров: N процессов разом наперегонки создавали бы таблицы,
+        # а на SQLite падали бы на старте с "database is locked"
+        migrate_database(self.bot_kwargs["db_path"])
+        asyncio.run(self._serve())
+
+    def health(self) -> Tuple[int, Dict[str, Any]]:
+        """HTTP-статус и тело /health: 503, если какой-то процесс мёртв."""
+        alive = {name: process.is_alive() for name, process in self.processes.items()}
+        body = {
+            "status": "ok" if all(alive.values()) else "degraded",
+            "workers": self.workers,
+            "processes": alive,
+            "restarts": dict(self.restarts),
+        }
+        return (200 if all(alive.values()) else 503), body
+
+    async def _serve(self) -> None:
+        from aiogram import Bot
+
+        context = multiprocessing.get_context("spawn")
+        transport = MultiprocessTransport(self.workers, context)
+        ocr_requests = context.Queue()
+        ocr_responses = [context.Queue() for _ in range(self.workers)]
+        ocr_kwargs = {
+            "inference_mode": self.config.ocr_inference_mode,
+            "num_threads": self.config.ocr_num_threads,
+            "num_interop_threads": self.config.ocr_num_interop_threads,
+        }
+        # Очереди переживают перезапуск процесса: новый воркер дочитывает обновления своего шарда
+        targets: Dict[str, Tuple[Callable[..., None], tuple]] = {
+            "ocr": (_ocr_service_main, (ocr_requests, ocr_responses, ocr_kwargs)),
+        }
+        for worker in range(self.workers):
+            targets[f"worker{worker}"] = (
+                _worker_main,
+                (
+                    worker,
+                    transport,
+                    ocr_requests,
+                    ocr_responses[worker],
+                    self.config.ocr_request_timeout_s,
+                    self.bot_kwargs,
+                ),
+            )
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        def start(name: str) -> None:
+            target, args = targets[name]
+            process = context.Process(target=target, args=args, name=name)
+            process.start()
+            self.processes[name] = process
+            loop.add_reader(process.sentinel, on_exit, name)
+
+        def on_exit(name: str) -> None:
+            process = self.processes[name]
+            loop.remove_reader(process.sentinel)
+            process.join()
+            logging.error(f"Процесс {name} завершился с кодом {process.exitcode}")
+            if name == "ocr":
+                # Ждущие ответа потоки воркеров получают ошибку, а не висят до таймаута
+                for responses in ocr_responses:
+                    responses.put((OCR_SERVICE_DIED, None, "OCR-сервис завершился"))
+            self.restarts[name] += 1
+            if self.restarts[name] > self.max_restarts:
+                logging.error(f"Процесс {name} упал {self.restarts[name]} раз, останавливаем фронт")
+                stop.set()
+                return
+            logging.warning(f"Перезапуск {name}")
+            start(name)
+
+        for name in targets:
+            start(name)
+        logging.info(f"Запущено воркеров: {self.workers}")
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        def dispatch(update: Update) -> None:
+            transport.send(shard_of(update, self.workers), update)
+
+        bot = Bot(token=self.config.token)
+        try:
+            if self.config.webhook_url:
+                await self._receive_webhook(bot, dispatch, stop)
+            else:
+                await self._receive_polling(bot, dispatch, stop)
+        finally:
+            # Дальше процессы завершаются штатно, перезапускать их не нужно
+            for process in self.processes.values():
+                loop.remove_reader(process.sentinel)
+            logging.info("Остановка: ждём, пока воркеры обработают очередь...")
+            for worker in range(self.workers):
+                transport.send(worker, None)
+            for worker in range(self.workers):
+                process = self.processes[f"worker{worker}"]
+                await asyncio.to_thread(process.join, self.drain_timeout)
+                if process.is_alive():
+                    process.kill()
+            ocr_requests.put(None)
+            await asyncio.to_thread(self.processes["ocr"].join, self.drain_timeout)
+            await bot.session.close()
+
+    async def _receive_polling(self, bot: Any, dispatch: Callable[[Update], None], stop: asyncio.Event) -> None:
+        from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+        await bot.delete_webhook()
+        offset: Optional[int] = None
+        backoff = 1.0
+        stopped = asyncio.create_task(stop.wait())
+        while not stop.is_set():
+            poll = asyncio.create_task(bot.get_updates(offset=offset, timeout=30))
+            await asyncio.wait([poll, stopped], return_when=asyncio.FIRST_COMPLETED)
+            if not poll.done():
+                poll.cancel()
+                break
+            try:
+                updates = poll.result()
+            except TelegramRetryAfter as e:
+                delay = float(e.retry_after)
+                logging.warning(f"Flood control при получении обновлений, ждём {delay}s")
+            except (TelegramNetworkError, TelegramServerError) as e:
+                delay, backoff = backoff, min(backoff * 2, 60.0)
+                logging.warning(f"Ошибка получения обновлений: {e}, повтор через {delay}s")
+            else:
+                backoff = 1.0
+                for update in updates:
+                    offset = update.update_id + 1
+                    dispatch(update.model_dump(mode="json", by_alias=True, exclude_unset=True))
+                continue
+            await asyncio.wait([stopped], timeout=delay)
+        stopped.cancel()
+
+    async def _receive_webhook(self, bot: Any, dispatch: Callable[[Update], None], stop: asyncio.Event) -> None:
+        from aiohttp import web
+        from bot import resolve_webhook_secret
+
+        secret = resolve_webhook_secret(self.config)
+
+        async def handle(request: web.Request) -> web.Response:
+            if not hmac.compare_digest(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), secret):
+                return web.Response(status=401)
+            dispatch(await request.json())
+            return web.Response()
+
+        async def health(request: web.Request) -> web.Response:
+            status, body = self.health()
+            return web.json_response(body, status=status)
+
+        if self.config.webhook_register:
+            await bot.set_webhook(url=self.config.webhook_url, secret_token=secret)
+        app = web.Application()
+        app.router.add_post(self.config.webhook_path, handle)
+        app.router.add_get("/health", health)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host=self.config.webhook_host, port=self.config.webhook_port).start()
+        try:
+            await stop.wait()
+        finally:
+            await runner.cleanup()
@@ -0,0 +1,10 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class Step_calc(BaseModel):
+    explanation: Optional[str] = Field(None, description="Четкое объяснение шага")
+    calculation: Optional[str] = Field(None, description="Математические операции и их результат")
+    verification: Optional[str] = Field(None, description="Как проверить этот шаг")
+    final_answer: Optional[str] = Field(None, description="Итоговый ответ уравнения")
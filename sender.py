@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+from cache import MISSING, TTLCache
+
+
+def is_valid_markdown(text: str) -> bool:
+    """
+    Проверяет, что текст разберётся в Telegram Markdown (legacy): все сущности закрыты,
+    у ссылок есть адрес. Сущности в этом режиме не вкладываются друг в друга.
+    """
+    i = 0
+    length = len(text)
+    while i < length:
+        char = text[i]
+        if char == "\\":
+            i += 2
+            continue
+        if text.startswith("```", i):
+            end = text.find("```", i + 3)
+            if end == -1:
+                return False
+            i = end + 3
+            continue
+        if char in "*_`":
+            end = text.find(char, i + 1)
+            if end == -1:
+                return False
+            i = end + 1
+            continue
+        if char == "[":
+            close = text.find("]", i + 1)
+            if close == -1:
+                return False
+            if text.startswith("(", close + 1):
+                end = text.find(")", close + 2)
+                if end == -1:
+                    return False
+                i = end + 1
+            else:
+                i = close + 1
+            continue
+        i += 1
+    return True
+
+
+class _TokenBucket:
+    """Бакет с резервированием: при нехватке токенов вызывающий ждёт свою очередь."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class OutboundSender:
+    """
+    Исходящие сообщения бота: режим разметки выбирается заранее по локальной проверке,
+    отправки ограничиваются по чату и глобально, а на 429 выдерживается retry_after.
+    """
+
+    def __init__(
+        self,
+        per_chat_rate: float = 1.0,
+        per_chat_burst: float = 3.0,
+        global_rate: float = 30.0,
+        max_retries: int = 3,
+    ):
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self._global = _TokenBucket(global_rate, global_rate)
+        self._chats: Dict[int, _TokenBucket] = {}
+        # Тексты, которые Telegram отверг несмотря на локальную проверку, дальше шлём без разметки
+        self._parse_modes = TTLCache(maxsize=10_000, ttl=3600)
+
+    async def reply(self, message: Message, text: str, **kwargs: Any) -> Message:
+        return await self._send(message.chat.id, text, lambda mode: message.reply(text, parse_mode=mode, **kwargs))
+
+    async def edit_text(self, message: Message, text: str, **kwargs: Any) -> Union[Message, bool]:
+        return await self._send(message.chat.id, text, lambda mode: message.edit_text(text, parse_mode=mode, **kwargs))
+
+    def choose_parse_mode(self, text: str) -> Optional[ParseMode]:
+        cached = self._parse_modes.get(text)
+        if cached is not MISSING:
+            return cached
+        return ParseMode.MARKDOWN if is_valid_markdown(text) else None
+
+    async def _send(self, chat_id: int, text: str, call: Callable[[Optional[ParseMode]], Awaitable[Any]]) -> Any:
+        parse_mode = self.choose_parse_mode(text)
+        retries = 0
+        while True:
+            await self._acquire(chat_id)
+            try:
+                return await call(parse_mode)
+            except TelegramRetryAfter as e:
+                if retries == self.max_retries:
+                    raise
+                retries += 1
+                logging.warning(f"Flood control в чате {chat_id}, ждём {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+            except TelegramBadRequest as e:
+                if parse_mode is None or "parse" not in str(e).lower():
+                    raise
+                self._parse_modes.set(text, None)
+                parse_mode = None
+
+    async def _acquire(self, chat_id: int) -> None:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10_000:
+                self._prune()
+            bucket = self._chats[chat_id] = _TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        delay = bucket.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        delay = self._global.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        idle = [
+            chat_id for chat_id, bucket in self._chats.items()
+            if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.burst
+        ]
+        for chat_id in idle:
+            del self._chats[chat_id]
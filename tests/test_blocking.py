@@ -0,0 +1,41 @@
+import asyncio
+import logging
+import os
+import time
+
+from blocking import BlockingDetector, _PROJECT_ROOT, _is_project_file
+from metrics import MetricsRegistry
+
+
+async def blocking_handler():
+    time.sleep(0.2)
+
+
+def test_detects_blocking_call_site(caplog):
+    metrics = MetricsRegistry()
+    detector = BlockingDetector(threshold_ms=50, heartbeat_ms=10, metrics=metrics)
+
+    async def scenario():
+        detector.start(asyncio.get_running_loop())
+        await asyncio.sleep(0.05)
+        await asyncio.create_task(blocking_handler())
+        # Сторожевой поток фиксирует блокировку, когда пульс возобновится
+        await asyncio.sleep(0.1)
+        await detector.stop()
+
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(scenario())
+    assert len(detector.counts) == 1
+    site, count = next(iter(detector.counts.items()))
+    assert count == 1
+    assert site.startswith(os.path.join("tests", "test_blocking.py")) and site.endswith("в blocking_handler")
+    assert detector.blocked_ms[site] >= 100
+    assert metrics.get("loop_blocked_total", site=site) == 1
+    assert any(f"в обработчике blocking_handler, место вызова {site}" in r.getMessage() for r in caplog.records)
+
+
+def test_virtualenv_inside_repo_is_not_project_code():
+    venv = os.path.join(_PROJECT_ROOT, ".venv", "lib", "python3.11", "site-packages", "aiogram", "client.py")
+    assert not _is_project_file(venv)
+    assert _is_project_file(os.path.join(_PROJECT_ROOT, "bot.py"))
+    assert not _is_project_file(os.path.join(_PROJECT_ROOT, "blocking.py"))
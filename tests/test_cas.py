@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("sympy")
+
+from cas import CasPool, UnsupportedProblem, latex_to_expression_text, solve_problem
+
+
+@pytest.mark.parametrize(
+    "text, kind, answer",
+    [
+        ("2x + 3 = 7", "linear", "x = 2"),
+        ("0.5x = 1", "linear", "x = 2"),
+        ("1{,}5x = 3", "linear", "x = 2"),
+        ("\\frac{x}{2} + \\frac{1}{3} = 1", "linear", "x = 4/3"),
+        ("x^2 - 5x + 6 = 0", "quadratic", "x1 = 2, x2 = 3"),
+        ("x^2 - 4x + 4 = 0", "quadratic", "x = 2"),
+        ("x^2 + 1 = 0", "quadratic", "действительных корней нет"),
+        ("x^3 - x = 0", "polynomial", "x = -1, x = 0, x = 1"),
+        ("x^3 + x = 0", "polynomial", "x = 0"),
+        ("\\begin{cases} x + y = 3 \\\\ x - y = 1 \\end{cases}", "system", "x = 2, y = 1"),
+        ("\\int_{0}^{1} x^2 \\, dx", "integral", "1/3"),
+        ("\\int \\sin x dx", "integral", "-cos(x) + C"),
+        ("\\frac{d}{dx} x^3", "derivative", "3*x^2"),
+    ],
+)
+def test_standard_classes(text, kind, answer):
+    solution = solve_problem(text)
+    assert solution is not None
+    assert solution.kind == kind
+    assert solution.answer == answer
+    assert solution.steps
+
+
+@pytest.mark.parametrize("text", ["\\sin x = \\frac{x}{2}", "x + a = 1", "x^{1/2} = 3", "\\alpha = 1"])
+def test_unsupported_goes_to_llm(text):
+    assert solve_problem(text) is None
+
+
+@pytest.mark.parametrize("latex", ["(x+1)^{5000}", "x^{999999} - x", "1234567890123 x"])
+def test_oversized_text_rejected(latex):
+    with pytest.raises(UnsupportedProblem):
+        latex_to_expression_text(latex)
+
+
+@pytest.mark.parametrize("text", ["9^{9^{9}}x = 1", "((x^{3})^{3})^{3} = 1", "2^{x \\cdot 9^{9^{9}}} = 1"])
+def test_power_towers_rejected_without_evaluation(text):
+    started_at = time.perf_counter()
+    assert solve_problem(text) is None
+    assert time.perf_counter() - started_at < 1.0
+
+
+def test_parser_does_not_evaluate_arbitrary_code():
+    with pytest.raises(UnsupportedProblem):
+        latex_to_expression_text("__import__('os').system('true')")
+
+
+def test_pool_solves_and_kills_on_timeout():
+    async def scenario():
+        pool = CasPool(processes=1, timeout=0.5)
+        try:
+            solution = await pool.solve("2x + 3 = 7")
+            assert solution is not None and solution.answer == "x = 2"
+            started_at = time.perf_counter()
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.solve("\\int e^{x^2} \\sin(x^3) dx")
+            assert time.perf_counter() - started_at < 5.0
+            # Убитый процесс заменяется новым
+            solution = await pool.solve("x^2 - 5x + 6 = 0")
+            assert solution is not None and solution.answer == "x1 = 2, x2 = 3"
+        finally:
+            pool.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from embeddings import EMBEDDING_MODEL_KEY, EmbeddingService, table_embedding_model
+
+
+def test_batch_encodes_queries_together():
+    service = EmbeddingService(batch_wait_ms=10)
+    calls = []
+
+    def encode(texts):
+        calls.append(texts)
+        return np.arange(len(texts), dtype=np.float32).reshape(-1, 1)
+
+    service.encode = encode
+
+    async def scenario():
+        return await asyncio.gather(service.embed_query("a"), service.embed_query("b"), service.embed_query("a"))
+
+    assert asyncio.run(scenario()) == [[0.0], [1.0], [0.0]]
+    assert calls == [["query: a", "query: b"]]
+
+
+def test_cancelled_batch_releases_waiters():
+    service = EmbeddingService(batch_wait_ms=0)
+    release = threading.Event()
+
+    def encode(texts):
+        release.wait(5)
+        return np.zeros((len(texts), 1), dtype=np.float32)
+
+    service.encode = encode
+
+    async def scenario():
+        waiter = asyncio.ensure_future(service.embed_query("a"))
+        while not service._batch_tasks:
+            await asyncio.sleep(0.01)
+        for task in service._batch_tasks:
+            task.cancel()
+        try:
+            with pytest.raises(RuntimeError):
+                await asyncio.wait_for(waiter, 1)
+        finally:
+            release.set()
+
+    asyncio.run(scenario())
+
+
+def test_table_embedding_model(tmp_path):
+    lancedb = pytest.importorskip("lancedb")
+    pa = pytest.importorskip("pyarrow")
+
+    vectordb = lancedb.connect(str(tmp_path))
+    data = pa.table({"text": ["a"], "vector": pa.FixedSizeListArray.from_arrays(pa.array([0.0, 1.0]), 2)})
+    ingested = vectordb.create_table("ingested", data=data.replace_schema_metadata({EMBEDDING_MODEL_KEY: b"m1"}))
+    ingested.add(data.replace_schema_metadata({EMBEDDING_MODEL_KEY: b"m1"}))
+    assert table_embedding_model(vectordb.open_table("ingested")) == "m1"
+    assert table_embedding_model(vectordb.create_table("other", data=data)) is None
@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from ephemeral import EphemeralStore, InMemoryEphemeralStore, RedisEphemeralStore
+
+
+class FakeRedis:
+    """Минимальный клиент с интерфейсом redis-py: set(ex=...), get, delete; время задаётся вручную."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.data = {}
+
+    def set(self, name, value, ex=None):
+        self.data[name] = (value.encode("utf-8"), self.now + ex if ex else None)
+
+    def get(self, name):
+        value, expires_at = self.data.get(name, (None, None))
+        if expires_at is not None and expires_at <= self.now:
+            del self.data[name]
+            return None
+        return value
+
+    def delete(self, name):
+        self.data.pop(name, None)
+
+
+def test_store_is_abstract():
+    with pytest.raises(TypeError):
+        EphemeralStore()
+
+
+def test_redis_store_with_fake_client():
+    client = FakeRedis()
+    store = RedisEphemeralStore(client, default_ttl=60, prefix="test:")
+    store.set("1:equation_text", "x^2 - 1 = 0")
+    assert store.get("1:equation_text") == "x^2 - 1 = 0"
+    assert "test:1:equation_text" in client.data
+
+    store.set("2:equation_text", "2x = 4", ttl=0.2)
+    assert client.data["test:2:equation_text"][1] == 1
+    client.now = 30
+    assert store.get("2:equation_text") is None
+    assert store.get("1:equation_text") == "x^2 - 1 = 0"
+    client.now = 61
+    assert store.get("1:equation_text") is None
+
+    store.set("3:equation_text", "x = 1")
+    store.delete("3:equation_text")
+    assert store.get("3:equation_text") is None
+
+
+def test_in_memory_store_expires_keys():
+    store = InMemoryEphemeralStore(default_ttl=60, gc_interval=0)
+    store.set("a", "1", ttl=0.01)
+    store.set("b", "2")
+    time.sleep(0.02)
+    assert store.get("a") is None
+    assert store.get("b") == "2"
+    store.set("c", "3", ttl=0.01)
+    time.sleep(0.02)
+    assert store.collect_garbage() == 1
+    assert len(store) == 1
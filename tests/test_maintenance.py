@@ -0,0 +1,24 @@
+import pytest
+
+lancedb = pytest.importorskip("lancedb")
+pa = pytest.importorskip("pyarrow")
+
+from embeddings import EMBEDDING_MODEL_KEY
+from maintenance import maintain_table
+
+
+def test_probe_uses_stored_vector_for_ingested_table(tmp_path):
+    rows = 20
+    vectors = pa.array([float(i % 7) for i in range(rows * 4)], type=pa.float32())
+    data = pa.table({
+        "text": [f"уравнение номер {i}" for i in range(rows)],
+        "source": ["учебник"] * rows,
+        "vector": pa.FixedSizeListArray.from_arrays(vectors, 4),
+    }).replace_schema_metadata({EMBEDDING_MODEL_KEY: b"m1"})
+    vectordb = lancedb.connect(str(tmp_path))
+    # Как после ingest.py: векторы без функции эмбеддингов LanceDB и полнотекстовый индекс
+    vectordb.create_table("algebra", data=data).create_fts_index("text")
+
+    result = maintain_table(vectordb, "algebra")
+    assert result["before_s"] is not None
+    assert result["after_s"] is not None
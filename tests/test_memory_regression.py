@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("PIL")
+
+from benchmarks.memory_regression import measure
+from memory import MemoryProfiler
+
+# Короткий прогон для CI; длинный — python -m benchmarks.memory_regression
+CYCLES = 40
+WARMUP = 10
+MAX_RSS_GROWTH_MB = 30.0
+MAX_HEAP_GROWTH_MB = 2.0
+
+
+def test_generate_and_solve_do_not_leak():
+    profiler = MemoryProfiler(frames=10)
+    try:
+        result = measure(cycles=CYCLES, warmup=WARMUP, chats=10, profiler=profiler)
+        heap_mb = result["heap_growth"] / 2 ** 20
+        rss_mb = result["rss_growth"] / 2 ** 20
+        report = profiler.report(limit=15)
+    finally:
+        profiler.stop()
+    assert heap_mb <= MAX_HEAP_GROWTH_MB, report
+    assert rss_mb <= MAX_RSS_GROWTH_MB, report
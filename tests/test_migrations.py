@@ -0,0 +1,34 @@
+from sqlalchemy import create_engine, func, select, text
+
+from database import Database, migrate_database
+from migrations import MIGRATIONS, _insert_initial_version, run_migrations, schema_version
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def version_rows(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(schema_version.c.id, schema_version.c.version)).all()
+
+
+def test_repeated_runs_keep_single_version_row(tmp_path):
+    url = f"sqlite:///{tmp_path / 'bot.db'}"
+    assert migrate_database(url) == LATEST
+    db = Database(url)
+    assert run_migrations(db.engine) == LATEST
+    with db.engine.begin() as conn:
+        # Второй процесс, опоздавший со вставкой начальной версии
+        _insert_initial_version(conn)
+    assert version_rows(db.engine) == [(1, LATEST)]
+
+
+def test_legacy_version_table_is_upgraded(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'bot.db'}")
+    with engine.begin() as conn:
+        # Прежняя таблица без ключа, в которую параллельный старт вставил две строки
+        conn.execute(text("CREATE TABLE schema_version (version INTEGER NOT NULL)"))
+        conn.execute(text("INSERT INTO schema_version (version) VALUES (1), (1)"))
+    assert migrate_database(str(engine.url)) == LATEST
+    assert version_rows(engine) == [(1, LATEST)]
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(schema_version)).scalar() == 1
@@ -0,0 +1,32 @@
+import logging
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from PIL import Image, ImageDraw
+
+from ocr_regions import MAX_REGIONS, detect_formula_regions
+
+
+def page(lines):
+    image = Image.new("RGB", (1000, 1400), "white")
+    draw = ImageDraw.Draw(image)
+    for i in range(lines):
+        draw.rectangle((100, 40 + i * 65, 700, 60 + i * 65), fill="black")
+    return image
+
+
+def test_lines_are_cropped_top_to_bottom():
+    crops = detect_formula_regions(page(5))
+    assert len(crops) == 5
+    assert all(crop.height < 200 for crop in crops)
+
+
+def test_too_many_lines_fall_back_to_whole_page(caplog):
+    image = page(MAX_REGIONS + 8)
+    with caplog.at_level(logging.WARNING):
+        crops = detect_formula_regions(image)
+    assert len(crops) == 1
+    assert crops[0].size == image.size
+    assert "распознаём страницу целиком" in caplog.text
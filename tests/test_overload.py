@@ -0,0 +1,60 @@
+import asyncio
+
+from metrics import MetricsRegistry
+from overload import Mode, OverloadController
+
+
+def make_controller(metrics=None):
+    return OverloadController(recover_samples=3, metrics=metrics or MetricsRegistry())
+
+
+def test_jumps_straight_to_target_stage():
+    controller = make_controller()
+    assert controller.update(0.5) == Mode.NORMAL
+    assert controller.update(2.5) == Mode.SHORT_HISTORY
+    assert controller.skip_rerank and controller.skip_verification and controller.shrink_history
+    assert not controller.reject_solve
+    assert controller.update(10.0) == Mode.REJECT_SOLVE
+
+
+def test_steps_down_one_stage_after_calm_samples():
+    controller = make_controller()
+    controller.update(2.5)
+    # Ниже порога ступени, но выше recover_ratio от него — не спокойно
+    assert [controller.update(1.9) for _ in range(5)] == [Mode.SHORT_HISTORY] * 5
+    calm = 1.5 * 0.7 - 0.01
+    assert [controller.update(calm) for _ in range(3)] == [Mode.SHORT_HISTORY] * 2 + [Mode.NO_VERIFICATION]
+    assert [controller.update(0.0) for _ in range(6)] == [Mode.NO_VERIFICATION] * 2 + [Mode.NO_RERANK] * 3 + [Mode.NORMAL]
+
+
+def test_spike_resets_calm_counter():
+    controller = make_controller()
+    controller.update(1.2)
+    controller.update(0.1)
+    controller.update(0.1)
+    # Всплеск выше порога восстановления обнуляет счётчик спокойных замеров
+    assert controller.update(0.9) == Mode.NO_RERANK
+    assert [controller.update(0.1) for _ in range(3)] == [Mode.NO_RERANK] * 2 + [Mode.NORMAL]
+
+
+def test_mode_changes_are_recorded():
+    metrics = MetricsRegistry()
+    controller = make_controller(metrics)
+    controller.update(2.0)
+    for _ in range(3):
+        controller.update(0.0)
+    assert metrics.get("overload_mode_changes", from_mode="NORMAL", to_mode="SHORT_HISTORY") == 1
+    assert metrics.get("overload_mode_changes", from_mode="SHORT_HISTORY", to_mode="NO_VERIFICATION") == 1
+    assert metrics.get("overload_mode") == int(Mode.NO_VERIFICATION)
+
+
+def test_pressure_and_inflight_tracking():
+    controller = OverloadController(max_llm_inflight=2, metrics=MetricsRegistry())
+
+    async def scenario():
+        async with controller.track("llm"):
+            async with controller.track("llm"):
+                return controller.pressure()
+
+    assert asyncio.run(scenario()) == 1.0
+    assert controller.inflight["llm"] == 0
@@ -0,0 +1,48 @@
+from retrieval import CHARS_PER_TOKEN, dedupe_chunks, estimate_tokens, fused_scores, select_context
+
+QUERY = "как решать квадратные уравнения"
+DISCRIMINANT = "Квадратное уравнение решается через дискриминант D=b^2-4ac."
+CANDIDATES = [DISCRIMINANT, "Как решать задачи: читать условие внимательно.", "Уравнения бывают разные."]
+
+
+def test_search_hit_without_common_words_is_kept():
+    assert DISCRIMINANT in select_context(QUERY, CANDIDATES)
+
+
+def test_fusion_keeps_search_rank_and_rewards_lexical_match():
+    scores = fused_scores(QUERY, CANDIDATES)
+    assert scores[0] > 0
+    assert scores[1] > scores[0]
+    # Без совпадений слов порядок поиска сохраняется
+    unmatched = fused_scores("интеграл", ["a", "b", "c"])
+    assert unmatched == sorted(unmatched, reverse=True)
+
+
+def test_tail_without_common_words_is_cut():
+    chunks = [f"уравнение номер {i}" for i in range(3)] + [f"посторонний текст {i}" for i in range(10)]
+    selected = select_context("уравнение", chunks, token_budget=10_000)
+    assert selected[:3] == chunks[:3]
+    assert "посторонний текст 9" not in selected
+
+
+def test_near_duplicates_removed():
+    chunk = "Дискриминант равен b в квадрате минус четыре a c, корни находятся по формуле"
+    chunks = [chunk, chunk + ".", "Теорема Виета связывает корни и коэффициенты"]
+    assert dedupe_chunks(chunks) == [chunk, chunks[2]]
+    assert len(select_context("дискриминант", chunks)) == 2
+
+
+def test_trimmed_to_token_budget():
+    chunks = [f"уравнение {i} " + "x" * 90 for i in range(10)]
+    selected = select_context("уравнение", chunks, token_budget=100)
+    assert sum(estimate_tokens(chunk) for chunk in selected) <= 100
+    assert 0 < len(selected) < len(chunks)
+
+
+def test_best_chunk_truncated_when_over_budget():
+    chunk = "уравнение " + "y" * 1000
+    assert select_context("уравнение", [chunk], token_budget=10) == [chunk[:10 * CHARS_PER_TOKEN]]
+
+
+def test_without_rerank_search_order_is_kept():
+    assert select_context(QUERY, CANDIDATES, rerank=False) == CANDIDATES
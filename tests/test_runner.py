@@ -0,0 +1,157 @@
+import asyncio
+import json
+import queue
+import random
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from types import SimpleNamespace
+
+import pytest
+
+from runner import (
+    OCR_SERVICE_DIED,
+    InProcessTransport,
+    RemoteMathOCR,
+    ShardedRunner,
+    Transport,
+    chat_id_of,
+    consume,
+    shard_of,
+)
+
+
+def message(update_id, chat_id, text="привет"):
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": text}}
+
+
+def callback(update_id, chat_id, user_id):
+    return {
+        "update_id": update_id,
+        "callback_query": {"from": {"id": user_id}, "message": {"chat": {"id": chat_id}}, "data": "confirm_equation"},
+    }
+
+
+def test_transport_is_abstract():
+    with pytest.raises(TypeError):
+        Transport()
+
+
+def test_chat_id_of():
+    assert chat_id_of(message(1, -100500)) == -100500
+    assert chat_id_of(callback(2, 42, 7)) == 42
+    assert chat_id_of({"update_id": 3, "callback_query": {"from": {"id": 7}}}) == 7
+    assert chat_id_of({"update_id": 4, "pre_checkout_query": {"from": {"id": 9}}}) == 9
+    assert chat_id_of({"update_id": 5, "poll": {}}) is None
+
+
+def test_shard_assignment_is_stable_per_chat():
+    workers = 4
+    for chat_id in (-100500, 1, 2, 3, 12345, 987654321):
+        shards = {shard_of(message(i, chat_id), workers) for i in range(20)}
+        shards.add(shard_of(callback(100, chat_id, 1), workers))
+        assert shards == {chat_id % workers}
+    # Обновления без чата распределяются по update_id
+    assert {shard_of({"update_id": i, "poll": {}}, workers) for i in range(8)} == set(range(workers))
+
+
+def test_consume_keeps_per_chat_order_and_runs_chats_in_parallel():
+    workers = 3
+    chats = [10, 11, 12, 13, 14, 15, 16]
+    updates = [message(i, chats[i % len(chats)], text=str(i)) for i in range(210)]
+
+    async def scenario():
+        transport = InProcessTransport(workers)
+        handled = {worker: [] for worker in range(workers)}
+        active = {"now": 0, "max": 0}
+        rng = random.Random(0)
+
+        def handler(worker):
+            async def handle(update):
+                active["now"] += 1
+                active["max"] = max(active["max"], active["now"])
+                await asyncio.sleep(rng.random() / 200)
+                handled[worker].append(update)
+                active["now"] -= 1
+            return handle
+
+        consumers = [asyncio.create_task(consume(transport, w, handler(w))) for w in range(workers)]
+        for update in updates:
+            transport.send(shard_of(update, workers), update)
+        for worker in range(workers):
+            transport.send(worker, None)
+        await asyncio.gather(*consumers)
+        return handled, active["max"]
+
+    handled, max_active = asyncio.run(scenario())
+    assert sum(len(items) for items in handled.values()) == len(updates)
+    for worker, items in handled.items():
+        for update in items:
+            assert shard_of(update, workers) == worker
+    for chat_id in chats:
+        received = [u["update_id"] for items in handled.values() for u in items if u["message"]["chat"]["id"] == chat_id]
+        assert received == [u["update_id"] for u in updates if u["message"]["chat"]["id"] == chat_id]
+    assert max_active > 1
+
+
+def test_consume_survives_handler_errors():
+    async def scenario():
+        transport = InProcessTransport(1)
+        handled = []
+
+        async def handle(update):
+            if update["update_id"] == 1:
+                raise RuntimeError("сбой обработчика")
+            handled.append(update["update_id"])
+
+        for update in (message(0, 5), message(1, 5), message(2, 5)):
+            transport.send(0, update)
+        transport.send(0, None)
+        await consume(transport, 0, handle)
+        return handled
+
+    assert asyncio.run(scenario()) == [0, 2]
+
+
+def serve_ocr(requests, responses, answer):
+    worker, request_id, images, temperature, detect_regions = requests.get()
+    responses.put((request_id, [answer] * len(images), None))
+
+
+def test_remote_ocr_times_out_and_survives_late_answer():
+    requests, responses = queue.Queue(), queue.Queue()
+    ocr = RemoteMathOCR(0, requests, responses, timeout=0.1)
+    with pytest.raises(FutureTimeoutError):
+        ocr.infer_pages(["page"], 0)
+    # Поздний ответ на просроченный запрос не роняет поток чтения ответов
+    worker, request_id, *_ = requests.get()
+    responses.put((request_id, ["поздно"], None))
+    threading.Thread(target=serve_ocr, args=(requests, responses, "x = 1")).start()
+    assert ocr.infer_pages(["page"], 0) == ["x = 1"]
+    assert not ocr._pending
+
+
+def test_remote_ocr_fails_pending_requests_when_service_dies():
+    requests, responses = queue.Queue(), queue.Queue()
+    ocr = RemoteMathOCR(0, requests, responses, timeout=5)
+
+    def die():
+        requests.get()
+        responses.put((OCR_SERVICE_DIED, None, "OCR-сервис завершился"))
+
+    threading.Thread(target=die).start()
+    with pytest.raises(RuntimeError, match="OCR-сервис завершился"):
+        ocr.infer_pages(["page"], 0)
+
+
+def test_health_reports_dead_process(tmp_path):
+    pytest.importorskip("aiogram")
+    config_path = tmp_path / "bot.json"
+    config_path.write_text(json.dumps({"token": "123456:" + "A" * 35}))
+    runner = ShardedRunner({"bot_config_path": str(config_path)}, workers=2)
+    runner.processes = {name: SimpleNamespace(is_alive=lambda: True) for name in ("ocr", "worker0", "worker1")}
+    assert runner.health()[0] == 200
+    runner.processes["worker1"] = SimpleNamespace(is_alive=lambda: False)
+    status, body = runner.health()
+    assert status == 503
+    assert body["status"] == "degraded"
+    assert body["processes"]["worker1"] is False
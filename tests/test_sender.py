@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+import sender
+from sender import OutboundSender, _TokenBucket, is_valid_markdown
+
+METHOD = SendMessage(chat_id=1, text="")
+
+
+@pytest.mark.parametrize(
+    "text, valid",
+    [
+        ("обычный текст", True),
+        ("*жирный* и _курсив_", True),
+        ("`x^2` и ```\ncode\n```", True),
+        ("[ссылка](https://example.com) и [просто скобки]", True),
+        ("a \\* b", True),
+        ("x_1 + x_2", True),
+        ("x_1 + y", False),
+        ("2 * 3 = 6", False),
+        ("```незакрытый код", False),
+        ("[ссылка](https://example.com", False),
+        ("[без конца", False),
+    ],
+)
+def test_is_valid_markdown(text, valid):
+    assert is_valid_markdown(text) is valid
+
+
+def test_token_bucket_delays(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(sender.time, "monotonic", lambda: now[0])
+    bucket = _TokenBucket(rate=2.0, burst=2)
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    now[0] += 1.0
+    # За секунду вернулось 2 токена, долг 2 уже зарезервированных запросов погашен
+    assert bucket.reserve() == 0.5
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(sender.asyncio, "sleep", fake_sleep)
+    return delays
+
+
+def test_retry_after_is_waited_and_retried(sleeps):
+    calls = []
+
+    async def call(mode):
+        calls.append(mode)
+        if len(calls) < 3:
+            raise TelegramRetryAfter(METHOD, "Too Many Requests", retry_after=7)
+        return "sent"
+
+    outbound = OutboundSender(per_chat_rate=1e9, per_chat_burst=1e9, global_rate=1e9)
+    assert asyncio.run(outbound._send(1, "текст", call)) == "sent"
+    assert calls == [ParseMode.MARKDOWN] * 3
+    assert sleeps == [7, 7]
+
+
+def test_retry_after_gives_up_after_max_retries(sleeps):
+    async def call(mode):
+        raise TelegramRetryAfter(METHOD, "Too Many Requests", retry_after=1)
+
+    outbound = OutboundSender(per_chat_rate=1e9, per_chat_burst=1e9, global_rate=1e9, max_retries=2)
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(outbound._send(1, "текст", call))
+    assert sleeps == [1, 1]
+
+
+def test_falls_back_to_plain_text_and_caches_it(sleeps):
+    calls = []
+
+    async def call(mode):
+        calls.append(mode)
+        if mode is not None:
+            raise TelegramBadRequest(METHOD, "Bad Request: can't parse entities")
+        return "sent"
+
+    outbound = OutboundSender(per_chat_rate=1e9, per_chat_burst=1e9, global_rate=1e9)
+    text = "*валидно локально*"
+    assert asyncio.run(outbound._send(1, text, call)) == "sent"
+    assert calls == [ParseMode.MARKDOWN, None]
+    # Повторная отправка того же текста сразу идёт без разметки
+    assert outbound.choose_parse_mode(text) is None
+    asyncio.run(outbound._send(1, text, call))
+    assert calls == [ParseMode.MARKDOWN, None, None]
+
+
+def test_other_bad_requests_are_raised(sleeps):
+    async def call(mode):
+        raise TelegramBadRequest(METHOD, "Bad Request: message to edit not found")
+
+    outbound = OutboundSender(per_chat_rate=1e9, per_chat_burst=1e9, global_rate=1e9)
+    with pytest.raises(TelegramBadRequest):
+        asyncio.run(outbound._send(1, "текст", call))
+    assert outbound.choose_parse_mode("текст") == ParseMode.MARKDOWN
+
+
+def test_per_chat_rate_limit_delays_sends(sleeps):
+    async def call(mode):
+        return "sent"
+
+    async def scenario():
+        outbound = OutboundSender(per_chat_rate=1.0, per_chat_burst=2, global_rate=1e9)
+        for _ in range(4):
+            await outbound._send(1, "текст", call)
+        # Другой чат не ждёт за первым
+        await outbound._send(2, "текст", call)
+
+    asyncio.run(scenario())
+    assert len(sleeps) == 2
+    assert sleeps[0] == pytest.approx(1.0, abs=0.05)
+    assert sleeps[1] == pytest.approx(2.0, abs=0.05)
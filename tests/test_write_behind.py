@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy.exc import OperationalError
+
+from database import Database
+from write_behind import WriteBehindQueue
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(f"sqlite:///{tmp_path / 'bot.db'}")
+
+
+def test_bad_row_is_isolated_and_dropped(db):
+    async def scenario():
+        writer = WriteBehindQueue(db, max_attempts=2)
+        for i in range(7):
+            writer.save_user_message(f"сообщение {i}", conv_id="c1", user_id=1)
+        bad = db.user_message_row("плохое", "c1", 1, None)
+        bad["role"] = None
+        writer._messages.insert(3, bad)
+        await writer.flush()
+        assert writer._messages == [bad]
+        await writer.flush()
+        assert writer._messages == []
+        return db.fetch_conversation("c1")
+
+    saved = asyncio.run(scenario())
+    assert [m["content"] for m in saved] == [f"сообщение {i}" for i in range(7)]
+
+
+def test_transient_errors_keep_rows_up_to_max_pending(db, monkeypatch):
+    def unavailable(messages, likes):
+        raise OperationalError("INSERT", {}, ConnectionError("нет соединения"))
+
+    async def scenario():
+        writer = WriteBehindQueue(db, max_attempts=1, max_pending=5)
+        monkeypatch.setattr(db, "save_rows", unavailable)
+        for i in range(8):
+            writer.save_user_message(f"сообщение {i}", conv_id="c1", user_id=1)
+        await writer.flush()
+        await writer.flush()
+        assert [row["content"] for row in writer._messages] == [f"сообщение {i}" for i in range(3, 8)]
+        monkeypatch.undo()
+        await writer.flush()
+        return db.fetch_conversation("c1")
+
+    assert len(asyncio.run(scenario())) == 5
+
+
+def test_stop_flushes_pending_rows(db):
+    async def scenario():
+        writer = WriteBehindQueue(db, flush_interval_ms=10_000)
+        writer.start()
+        writer.save_user_message("последнее", conv_id="c1", user_id=1)
+        await writer.stop()
+        return db.fetch_conversation("c1")
+
+    assert [m["content"] for m in asyncio.run(scenario())] == ["последнее"]
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from database import Database
+
+Rows = List[Dict[str, Any]]
+
+
+def _is_transient(error: Exception) -> bool:
+    """Ошибка соединения с базой, а не данных: пакет целиком повторяется позже."""
+    return isinstance(error, (OperationalError, InterfaceError, ConnectionError, TimeoutError))
+
+
+class WriteBehindQueue:
+    """
+    Отложенная запись сообщений и оценок: строки копятся в памяти и сбрасываются
+    в базу одной пакетной вставкой раз в flush_interval_ms или по достижении max_batch_size.
+
+    Если пакет отвергнут из-за данных, он делится пополам, пока плохие строки не останутся
+    поодиночке; такая строка повторяется не больше max_attempts раз и затем отбрасывается в лог.
+    При недоступной базе строки ждут в очереди, но не больше max_pending штук.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        flush_interval_ms: int = 200,
+        max_batch_size: int = 500,
+        max_attempts: int = 3,
+        max_pending: int = 100_000,
+    ):
+        self.db = db
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_attempts = max_attempts
+        self.max_pending = max_pending
+        self._messages: Rows = []
+        self._likes: Rows = []
+        # Число неудачных попыток по id(строки) для строк, отвергнутых из-за данных
+        self._attempts: Dict[int, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # Без cancel: цикл доделывает текущий сброс и выходит
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        for attempt in range(self.max_attempts):
+            await self.flush()
+            if not self._messages and not self._likes:
+                return
+            await asyncio.sleep(self.flush_interval * 2 ** attempt)
+        self._drop(self._messages, self._likes, "база недоступна при остановке")
+        self._messages, self._likes = [], []
+
+    def save_user_message(
+        self,
+        content: Union[None, str, List[Dict[str, Any]]],
+        conv_id: str,
+        user_id: int,
+        user_name: Optional[str] = None,
+    ) -> None:
+        self._enqueue_message(self.db.user_message_row(content, conv_id, user_id, user_name))
+
+    def save_assistant_message(
+        self,
+        content: Union[str, List[Dict[str, Any]]],
+        conv_id: str,
+        message_id: int,
+        reply_user_id: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+        rag_promt: Optional[str] = None,
+    ) -> None:
+        self._enqueue_message(
+            self.db.assistant_message_row(content, conv_id, message_id, reply_user_id, system_prompt, rag_promt)
+        )
+
+    def save_feedback(self, feedback: str, user_id: int, message_id: int) -> None:
+        self._likes.append(self.db.feedback_row(feedback, user_id, message_id))
+        self._maybe_wakeup()
+
+    async def fetch_conversation(self, conv_id: str, include_archive: bool = False) -> List[Any]:
+        """Чтение диалога с гарантией read-your-writes для ещё не сброшенных строк."""
+        await self._flush_pending(conv_id)
+        return await asyncio.to_thread(self.db.fetch_conversation, conv_id, include_archive)
+
+    async def fetch_history_page(self, conv_id: str, **kwargs: Any) -> Tuple[List[Dict[str, Any]], bool]:
+        await self._flush_pending(conv_id)
+        return await asyncio.to_thread(self.db.fetch_history_page, conv_id, **kwargs)
+
+    async def _flush_pending(self, conv_id: str) -> None:
+        if self._flush_lock.locked() or any(m["conv_id"] == conv_id for m in self._messages):
+            await self.flush()
+
+    async def flush(self) -> None:
+        # shield: отмена вызывающего не бросает пакет на полпути, неудавшиеся строки вернутся в очередь
+        await asyncio.shield(self._flush())
+
+    async def _flush(self) -> None:
+        async with self._flush_lock:
+            messages, self._messages = self._messages, []
+            likes, self._likes = self._likes, []
+            if not messages and not likes:
+                return
+            failed_messages, failed_likes = await self._save(messages, likes)
+            # Возвращаем строки в начало очереди, чтобы сохранить порядок сообщений
+            self._messages = failed_messages + self._messages
+            self._likes = failed_likes + self._likes
+            self._trim()
+
+    async def _save(self, messages: Rows, likes: Rows) -> Tuple[Rows, Rows]:
+        """Записывает пакет; возвращает строки, которые нужно повторить."""
+        try:
+            await asyncio.to_thread(self.db.save_rows, messages, likes)
+        except Exception as e:
+            total = len(messages) + len(likes)
+            if _is_transient(e):
+                logging.error(f"База недоступна, {total} строк ждут повтора: {e}")
+                return messages, likes
+            if total == 1:
+                logging.error(f"Строка отвергнута базой: {e}")
+                return self._retry_or_drop(messages, likes)
+            # Делим пакет пополам, чтобы отложить только плохие строки
+            half = total // 2
+            split = max(0, half - len(messages))
+            first = await self._save(messages[:half], likes[:split])
+            second = await self._save(messages[half:], likes[split:])
+            return first[0] + second[0], first[1] + second[1]
+        for row in messages + likes:
+            self._attempts.pop(id(row), None)
+        return [], []
+
+    def _retry_or_drop(self, messages: Rows, likes: Rows) -> Tuple[Rows, Rows]:
+        """Одиночная отвергнутая строка повторяется, пока не исчерпает max_attempts."""
+        row = (messages or likes)[0]
+        attempts = self._attempts.get(id(row), 0) + 1
+        if attempts < self.max_attempts:
+            self._attempts[id(row)] = attempts
+            return messages, likes
+        self._drop(messages, likes, f"отвергнута {attempts} раз")
+        return [], []
+
+    def _trim(self) -> None:
+        excess = len(self._messages) + len(self._likes) - self.max_pending
+        if excess <= 0:
+            return
+        # Отбрасываются самые старые строки
+        dropped_messages, self._messages = self._messages[:excess], self._messages[excess:]
+        excess -= len(dropped_messages)
+        dropped_likes, self._likes = self._likes[:excess], self._likes[excess:]
+        self._drop(dropped_messages, dropped_likes, f"очередь больше {self.max_pending} строк")
+
+    def _drop(self, messages: Rows, likes: Rows, reason: str) -> None:
+        if not messages and not likes:
+            return
+        for row in messages + likes:
+            self._attempts.pop(id(row), None)
+        logging.error(
+            f"Отброшено {len(messages)} сообщений и {len(likes)} оценок ({reason}): "
+            + "; ".join(repr(row)[:200] for row in messages + likes)
+        )
+
+    def _enqueue_message(self, row: Dict[str, Any]) -> None:
+        self._messages.append(row)
+        self._maybe_wakeup()
+
+    def _maybe_wakeup(self) -> None:
+        if len(self._messages) + len(self._likes) >= self.max_batch_size:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()